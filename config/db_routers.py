@@ -0,0 +1,161 @@
+"""
+Primary/replica routing for safe reads.
+
+Nothing goes to the replica by default. Views opt in by running their
+reads inside replica_reads(), and even then reads stay on the primary
+while a transaction is open, or for REPLICA_PIN_SECONDS after the user's
+own last write so they always see it.
+
+The pin travels with the client as a signed, timestamped cookie rather
+than in a cache, so it holds whichever worker process serves the next
+request and needs no shared cache server.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_DB_ALIAS = 'replica'
+PIN_COOKIE = 'db_pin'
+PIN_SALT = 'config.db_routers.pin'
+
+_use_replica = ContextVar('use_replica', default=False)
+# Set by primary_reads(), and checked apart from _use_replica so a
+# replica_reads() nested inside it can't turn the replica back on
+_force_primary = ContextVar('force_primary', default=False)
+
+
+def pin_to_primary(response, user):
+    """
+    Keep the user's reads on the primary until the replica has caught up
+    with what they just wrote, by setting the pin cookie on ``response``.
+    """
+    response.set_signed_cookie(
+        PIN_COOKIE,
+        str(user.pk),
+        salt=PIN_SALT,
+        max_age=settings.REPLICA_PIN_SECONDS,
+        httponly=True,
+        samesite='Lax',
+        )
+
+
+def is_pinned(request):
+    """
+    Whether the request carries an unexpired pin for its own user.
+    """
+    user = getattr(request, 'user', None)
+    if not (user and user.is_authenticated):
+        return False
+    pinned = request.get_signed_cookie(
+        PIN_COOKIE,
+        default=None,
+        salt=PIN_SALT,
+        max_age=settings.REPLICA_PIN_SECONDS,
+        )
+    return pinned == str(user.pk)
+
+
+@contextmanager
+def replica_reads(request=None):
+    """
+    Route reads made inside the block to the replica, if one is
+    configured and the request's user isn't pinned to the primary.
+    """
+    if REPLICA_DB_ALIAS not in settings.DATABASES or (
+        request is not None and is_pinned(request)
+    ):
+        yield
+        return
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """
+    Keep reads made inside the block on the primary, even within
+    replica_reads() and even if code it calls opens replica_reads()
+    again, for results that must not lag behind it.
+    """
+    token = _force_primary.set(True)
+    try:
+        yield
+    finally:
+        _force_primary.reset(token)
+
+
+def wants_replica():
+    """
+    Whether reads made here were routed to the replica, before the
+    transaction check.
+    """
+    return _use_replica.get() and not _force_primary.get()
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if wants_replica() and not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return REPLICA_DB_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaReadMixin:
+    """
+    ViewSet mixin serving list and retrieve from the replica.
+    """
+
+    def list(self, request, *args, **kwargs):
+        with replica_reads(request):
+            return super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        with replica_reads(request):
+            return super().retrieve(request, *args, **kwargs)
+
+
+class ReplicaPinMiddleware:
+    """
+    Pin authenticated users to the primary after any write request.
+
+    Works in both sync and async chains, like MetricsMiddleware, so it
+    doesn't push the async views back onto a worker thread under ASGI.
+    """
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+
+    def process_response(self, request, response):
+        # DRF copies the user it authenticates back onto the HttpRequest
+        user = getattr(request, 'user', None)
+        if request.method not in self.SAFE_METHODS and user and user.is_authenticated:
+            pin_to_primary(response, user)
+        return response
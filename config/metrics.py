@@ -0,0 +1,269 @@
+"""
+Per-route latency and database metrics.
+
+MetricsMiddleware times every request and counts the queries it runs and
+the time spent in them, keyed on the resolved URL name. Stats objects are
+created once per route with their label text preformatted, so recording
+a request only bumps numbers. prometheus_metrics serves them in the
+Prometheus text format and MetricsView as JSON for staff.
+"""
+import threading
+import time
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from django.urls import URLResolver, get_resolver
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from users.authentication import user_cache
+
+# Latency histogram upper bounds, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+UNMATCHED = 'unmatched'
+
+# The QueryTimer of the request in progress. Context variables follow
+# the async ORM into its sync_to_async threads, where its queries run.
+current_timer = ContextVar('metrics_query_timer', default=None)
+
+
+class RouteStats:
+
+    def __init__(self, route):
+        self.route = route
+        self.label = 'route="%s"' % route.replace('\\', '\\\\').replace('"', '\\"')
+        self.bucket_counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.seconds = 0.0
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, seconds, queries, db_seconds):
+        index = 0
+        for bound in BUCKETS:
+            if seconds <= bound:
+                break
+            index += 1
+        with self.lock:
+            self.bucket_counts[index] += 1
+            self.count += 1
+            self.seconds += seconds
+            self.queries += queries
+            self.db_seconds += db_seconds
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                'requests': self.count,
+                'seconds': self.seconds,
+                'queries': self.queries,
+                'db_seconds': self.db_seconds,
+                'buckets': dict(zip(
+                    [str(bound) for bound in BUCKETS] + ['+Inf'],
+                    self.bucket_counts
+                )),
+            }
+
+
+def _route_names(patterns, namespace=''):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            prefix = namespace
+            if pattern.namespace:
+                prefix = f'{namespace}{pattern.namespace}:'
+            yield from _route_names(pattern.url_patterns, prefix)
+        elif pattern.name:
+            yield f'{namespace}{pattern.name}'
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self.routes = {}
+        self.lock = threading.Lock()
+
+    def preallocate(self):
+        for name in _route_names(get_resolver().url_patterns):
+            self.get(name)
+        self.get(UNMATCHED)
+
+    def get(self, route):
+        stats = self.routes.get(route)
+        if stats is None:
+            # Only reached for routes missed at startup, e.g. unnamed views
+            with self.lock:
+                stats = self.routes.setdefault(route, RouteStats(route))
+        return stats
+
+
+registry = MetricsRegistry()
+
+
+class QueryTimer:
+    """
+    Connection execute wrapper that accumulates query count and time for
+    the request in progress.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.seconds += time.perf_counter() - started
+
+
+def time_query(execute, sql, params, many, context):
+    """
+    Execute wrapper that hands each query to the current request's
+    QueryTimer, if any.
+    """
+    timer = current_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+def install_query_timer(connection, **kwargs):
+    """
+    Add time_query() to a connection's execute wrappers once. Connected to
+    connection_created, so the per-thread connections of sync_to_async
+    threads get it too.
+    """
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+connection_created.connect(install_query_timer)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        registry.preallocate()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # Connections opened before this module was imported missed
+        # connection_created
+        for connection in connections.all(initialized_only=True):
+            install_query_timer(connection)
+        timer = QueryTimer()
+        token = current_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timer.reset(token)
+        self.record(request, time.perf_counter() - started, timer)
+        return response
+
+    async def __acall__(self, request):
+        # The async ORM runs queries on connections that belong to other
+        # threads, so they can't be wrapped from here; the context
+        # variable carries the timer to them instead
+        timer = QueryTimer()
+        token = current_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timer.reset(token)
+        self.record(request, time.perf_counter() - started, timer)
+        return response
+
+    def record(self, request, seconds, timer):
+        match = request.resolver_match
+        route = match.view_name if match else UNMATCHED
+        registry.get(route).record(seconds, timer.queries, timer.seconds)
+
+
+def render_prometheus():
+    lines = [
+        '# HELP http_request_duration_seconds Request latency by route.',
+        '# TYPE http_request_duration_seconds histogram',
+    ]
+    routes = list(registry.routes.values())
+    for stats in routes:
+        with stats.lock:
+            cumulative = 0
+            for bound, count in zip(BUCKETS, stats.bucket_counts):
+                cumulative += count
+                lines.append(
+                    f'http_request_duration_seconds_bucket'
+                    f'{{{stats.label},le="{bound}"}} {cumulative}'
+                )
+            lines.append(
+                f'http_request_duration_seconds_bucket'
+                f'{{{stats.label},le="+Inf"}} {stats.count}'
+            )
+            lines.append(
+                f'http_request_duration_seconds_sum{{{stats.label}}} {stats.seconds}'
+            )
+            lines.append(
+                f'http_request_duration_seconds_count{{{stats.label}}} {stats.count}'
+            )
+    for metric, attribute, help_text in (
+        ('http_request_db_queries_total', 'queries', 'Database queries run by route.'),
+        ('http_request_db_seconds_total', 'db_seconds', 'Time spent in database queries by route.'),
+    ):
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} counter')
+        for stats in routes:
+            lines.append(f'{metric}{{{stats.label}}} {getattr(stats, attribute)}')
+
+    cache_stats = user_cache.stats()
+    lines += [
+        '# HELP jwt_user_cache_hits_total JWT user cache hits.',
+        '# TYPE jwt_user_cache_hits_total counter',
+        f"jwt_user_cache_hits_total {cache_stats['hits']}",
+        '# HELP jwt_user_cache_misses_total JWT user cache misses.',
+        '# TYPE jwt_user_cache_misses_total counter',
+        f"jwt_user_cache_misses_total {cache_stats['misses']}",
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def prometheus_metrics(request):
+    """
+    Prometheus scrape endpoint. When METRICS_TOKEN is set the scraper has
+    to send it as a bearer token.
+    """
+    token = settings.METRICS_TOKEN
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponseForbidden()
+    return HttpResponse(
+        render_prometheus(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
+class MetricsView(APIView):
+    """
+    The same metrics as JSON, for staff.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            'routes': {
+                route: stats.as_dict()
+                for route, stats in list(registry.routes.items())
+            },
+            'jwt_user_cache': user_cache.stats(),
+        })
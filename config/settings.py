@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 from pathlib import Path
+from tempfile import gettempdir
 from decouple import config
 from datetime import timedelta
 
@@ -47,18 +48,19 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "users.authentication.CachedJWTAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
     "DEFAULT_THROTTLE_CLASSES": [
-        "rest_framework.throttling.UserRateThrottle",
-        "rest_framework.throttling.AnonRateThrottle",
+        "users.throttling.UserRateThrottle",
+        "users.throttling.AnonRateThrottle",
     ],
     "DEFAULT_THROTTLE_RATES": {
         "user": "10/minute",
         "anon": "5/hour",
+        "quote": "120/minute",
     }
 }
 
@@ -68,10 +70,61 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# Shared counters behind users.throttling. The SQLite store is shared by
+# every process on one host; in production point it at a cache alias whose
+# backend has an atomic incr, e.g. BACKEND=users.throttling.CacheCounterStore
+# and LOCATION=default with a Redis CACHE_BACKEND.
+THROTTLE_STORE = {
+    'BACKEND': config(
+        'THROTTLE_STORE_BACKEND',
+        default='users.throttling.SQLiteCounterStore'
+    ),
+    'LOCATION': config(
+        'THROTTLE_STORE_LOCATION',
+        default=str(Path(gettempdir()) / 'online-store-throttle.sqlite3')
+    ),
+}
+
+# In-process cache of the users behind JWTs (users.authentication)
+JWT_USER_CACHE_SIZE = 10000
+JWT_USER_CACHE_TTL = 30
+
+# Orders below the threshold pay a percentage of the order total as delivery
+FREE_DELIVERY_THRESHOLD = 50
+STANDARD_DELIVERY_PERCENTAGE = 10
+
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 DEFAULT_FROM_EMAIL = 'your@email.com'
+FRONTEND_URL = config('FRONTEND_URL', default='http://localhost:3000')
+
+# Outbox worker (manage.py send_queued_emails): retries back off
+# exponentially from EMAIL_RETRY_BACKOFF seconds, giving up after
+# EMAIL_MAX_ATTEMPTS failed deliveries. A claimed batch is left to its
+# worker for EMAIL_CLAIM_TIMEOUT seconds before another may retry it.
+EMAIL_MAX_ATTEMPTS = 5
+EMAIL_RETRY_BACKOFF = 30
+EMAIL_CLAIM_TIMEOUT = config('EMAIL_CLAIM_TIMEOUT', cast=int, default=300)
+
+# Password reset links stop working after this long; expired tokens are
+# deleted by manage.py purge_password_reset_tokens.
+PASSWORD_RESET_TOKEN_LIFETIME = timedelta(
+    hours=config('PASSWORD_RESET_TOKEN_HOURS', cast=int, default=24)
+    )
+
+# Idempotency-Key replays (users.idempotency). Responses are kept for
+# IDEMPOTENCY_KEY_TTL. A duplicate that arrives while the first request
+# is running waits up to IDEMPOTENCY_WAIT seconds (0 to answer 409 at
+# once) for its response, and a request still unfinished after
+# IDEMPOTENCY_LOCK_TIMEOUT seconds is presumed dead. manage.py
+# purge_idempotency_keys deletes expired keys.
+IDEMPOTENCY_KEY_TTL = timedelta(
+    hours=config('IDEMPOTENCY_KEY_HOURS', cast=int, default=24)
+    )
+IDEMPOTENCY_LOCK_TIMEOUT = config('IDEMPOTENCY_LOCK_TIMEOUT', cast=int, default=60)
+IDEMPOTENCY_WAIT = config('IDEMPOTENCY_WAIT', cast=float, default=5)
 
 MIDDLEWARE = [
+    'config.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,14 +132,18 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'config.db_routers.ReplicaPinMiddleware',
 ]
 
+# Bearer token Prometheus must send to scrape /metrics (open when empty)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': [],
+        'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
@@ -105,17 +162,69 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Set DB_ENGINE=django.db.backends.sqlite3 and DB_NAME to a file path to
+# run locally (e.g. the test and benchmark suites) without PostgreSQL.
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': config('DB_ENGINE', default='django.db.backends.postgresql'),
         'NAME': config('DB_NAME'),
-        'USER': config('DB_USER'),
-        'PASSWORD': config('DB_PASSWORD'),
+        'USER': config('DB_USER', default=''),
+        'PASSWORD': config('DB_PASSWORD', default=''),
         'HOST': config('DB_HOST', default='localhost'),
         'PORT': config('DB_PORT', default='5432'),
     }
 }
 
+# Optional read replica for catalog and order-history reads. Set
+# REPLICA_DB_HOST (and REPLICA_DB_PORT) to a streaming replica of the
+# primary, or REPLICA_DB_NAME to a second SQLite file to stand one in.
+if config('REPLICA_DB_HOST', default='') or config('REPLICA_DB_NAME', default=''):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': config('REPLICA_DB_NAME', default=DATABASES['default']['NAME']),
+        'HOST': config('REPLICA_DB_HOST', default=DATABASES['default']['HOST']),
+        'PORT': config('REPLICA_DB_PORT', default=DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['config.db_routers.PrimaryReplicaRouter']
+
+# Seconds a login remembers that an email has no unclaimed guest orders.
+# New guest orders clear the flag; the timeout bounds how long a worker
+# whose cache didn't see that (a per-process cache) skips the claim.
+GUEST_ORDERS_FLAG_TIMEOUT = config(
+    'GUEST_ORDERS_FLAG_TIMEOUT', cast=int, default=300
+    )
+
+# Seconds a user's reads stay on the primary after they write, carried in
+# a signed cookie (config.db_routers.ReplicaPinMiddleware)
+REPLICA_PIN_SECONDS = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Point CACHE_BACKEND/CACHE_LOCATION at a shared backend (e.g. Redis) in
+# production so cache invalidation is seen by every worker process.
+
+CACHES = {
+    'default': {
+        'BACKEND': config(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+
+# Seconds the in-process price table (store.pricing) trusts the catalog
+# version before checking the change feed anyway. Bounds how stale quotes
+# can be on workers whose cache didn't see a version bump.
+PRICE_TABLE_MAX_AGE = config('PRICE_TABLE_MAX_AGE', cast=int, default=10)
+
+# Seconds a rendered catalog response stays cached for a given version.
+CATALOG_CACHE_TIMEOUT = config('CATALOG_CACHE_TIMEOUT', cast=int, default=300)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
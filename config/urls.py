@@ -4,10 +4,14 @@ from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
 )
+from config.metrics import MetricsView, prometheus_metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('store.urls')),
+    path('', include('users.urls')),
+    path('metrics', prometheus_metrics, name='metrics'),
+    path('api/metrics/', MetricsView.as_view(), name='metrics-json'),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 ]
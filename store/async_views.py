@@ -0,0 +1,173 @@
+"""
+Native async implementations of the hot read paths.
+
+Plain Django async views, so under ASGI (config/asgi.py) they run on the
+event loop instead of taking a worker thread for the whole request. They
+mirror the DRF views' responses, using simple ``after``/``before`` id
+keysets for paging.
+"""
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseNotAllowed, JsonResponse
+from rest_framework.exceptions import AuthenticationFailed, Throttled
+from rest_framework.views import APIView
+from config.db_routers import replica_reads
+from users.authentication import CachedJWTAuthentication
+from .models import Order, Product
+from .pagination import OrderCursorPagination, ProductCursorPagination
+from .serializers import (
+    ProductSerializer,
+    order_list_values_serializer,
+    product_values_serializer,
+)
+
+
+def _check_throttles(request):
+    """
+    Run the API's default throttles, as APIView.check_throttles() does.
+
+    Returns:
+        Throttled: The error to answer with, or None when the request is
+        allowed.
+    """
+    view = APIView()
+    durations = [
+        throttle.wait() for throttle in view.get_throttles()
+        if not throttle.allow_request(request, view)
+    ]
+    if not durations:
+        return None
+    durations = [duration for duration in durations if duration is not None]
+    return Throttled(max(durations, default=None))
+
+
+def async_read_view(view):
+    """
+    Allow only GET, require a valid JWT, resolved without leaving the
+    event loop when the user is cached, and apply the same
+    DEFAULT_THROTTLE_CLASSES as the DRF views.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return HttpResponseNotAllowed(['GET'])
+        try:
+            auth = await CachedJWTAuthentication().aauthenticate(request)
+        except AuthenticationFailed as exc:
+            detail = exc.detail
+            if not isinstance(detail, dict):
+                detail = {'detail': detail}
+            return JsonResponse(detail, status=401)
+        if auth is None:
+            return JsonResponse(
+                {'detail': 'Authentication credentials were not provided.'},
+                status=401
+                )
+        request.user, request.auth = auth
+        # The counter stores block, so they run off the event loop
+        exc = await sync_to_async(_check_throttles)(request)
+        if exc is not None:
+            response = JsonResponse({'detail': exc.detail}, status=exc.status_code)
+            if exc.wait is not None:
+                response['Retry-After'] = '%d' % exc.wait
+            return response
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def _int_param(request, name, default, maximum=None):
+    try:
+        value = int(request.GET.get(name, default))
+    except ValueError:
+        value = default
+    value = max(value, 0)
+    return min(value, maximum) if maximum else value
+
+
+def _next_url(request, name, value):
+    params = request.GET.copy()
+    params.pop('after', None)
+    params.pop('before', None)
+    params[name] = value
+    return request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+
+
+@async_read_view
+async def product_list(request):
+    page_size = _int_param(
+        request,
+        'page_size',
+        ProductCursorPagination.page_size,
+        ProductCursorPagination.max_page_size,
+        ) or ProductCursorPagination.page_size
+    after = _int_param(request, 'after', 0)
+    with replica_reads(request):
+        rows = [
+            row async for row in Product.objects
+            .filter(id__gt=after)
+            .order_by('id')
+            .values(*product_values_serializer.columns)[:page_size + 1]
+            .aiterator()
+        ]
+    next_url = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_url = _next_url(request, 'after', rows[-1]['id'])
+    return JsonResponse({
+        'next': next_url,
+        'results': product_values_serializer.many(rows),
+    })
+
+
+@async_read_view
+async def product_detail(request, pk):
+    try:
+        with replica_reads(request):
+            product = await Product.objects.aget(pk=pk)
+    except Product.DoesNotExist:
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+    return JsonResponse(ProductSerializer(product).data)
+
+
+@async_read_view
+async def order_list(request):
+    """
+    The authenticated user's orders, newest first, paged and rendered as
+    OrderListView does. ``before`` pages to older orders and ``after``
+    back to newer ones.
+    """
+    page_size = _int_param(
+        request,
+        'page_size',
+        OrderCursorPagination.page_size,
+        OrderCursorPagination.max_page_size,
+        ) or OrderCursorPagination.page_size
+    orders = Order.objects.filter(customer__user_id=request.user.pk)
+    before = _int_param(request, 'before', 0)
+    after = _int_param(request, 'after', 0)
+    if after:
+        orders = orders.filter(id__gt=after).order_by('id')
+    elif before:
+        orders = orders.filter(id__lt=before).order_by('-id')
+    else:
+        orders = orders.order_by('-id')
+    with replica_reads(request):
+        rows = [
+            row async for row in orders
+            .values('id', *order_list_values_serializer.columns)[:page_size + 1]
+            .aiterator()
+        ]
+    more = len(rows) > page_size
+    rows = rows[:page_size]
+    if after:
+        rows.reverse()
+    next_url = previous_url = None
+    if rows and (more or after):
+        next_url = _next_url(request, 'before', rows[-1]['id'])
+    if rows and (more if after else before):
+        previous_url = _next_url(request, 'after', rows[0]['id'])
+    return JsonResponse({
+        'next': next_url,
+        'previous': previous_url,
+        'results': order_list_values_serializer.many(rows),
+    })
@@ -0,0 +1,77 @@
+import csv
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from .models import Order, OrderItem
+
+ORDER_FIELDS = [
+    'id', 'order_number', 'date', 'status', 'customer_id', 'email',
+    'order_total', 'delivery_cost', 'total_price',
+]
+ITEM_FIELDS = ['product_id', 'quantity', 'item_total']
+
+
+class Echo:
+    """
+    File-like object whose write() just returns what it was given, so
+    csv.writer can be used to produce lines for a streaming response.
+    """
+
+    def write(self, value):
+        return value
+
+
+def export_orders(filters, chunk_size=2000):
+    """
+    Return an iterator over the orders matching ``filters`` in id order,
+    with their items, reading ``chunk_size`` orders per round trip.
+
+    On PostgreSQL .iterator() uses a server-side cursor, so memory stays
+    flat however many orders are exported.
+    """
+    orders = Order.objects.only(*ORDER_FIELDS).order_by('id')
+    if filters.get('after_id'):
+        orders = orders.filter(id__gt=filters['after_id'])
+    if filters.get('date_from'):
+        orders = orders.filter(date__date__gte=filters['date_from'])
+    if filters.get('date_to'):
+        orders = orders.filter(date__date__lte=filters['date_to'])
+    if filters.get('status'):
+        orders = orders.filter(status=filters['status'])
+    orders = orders.prefetch_related(Prefetch(
+        'items',
+        queryset=OrderItem.objects.only('order_id', *ITEM_FIELDS).order_by('id'),
+    ))
+    return orders.iterator(chunk_size=chunk_size)
+
+
+def stream_csv(orders):
+    """
+    Yield a header and one CSV line per order item. Orders without items
+    get a single line with the item columns left empty.
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(ORDER_FIELDS + ITEM_FIELDS)
+    for order in orders:
+        row = [getattr(order, field) for field in ORDER_FIELDS]
+        items = order.items.all()
+        if not items:
+            yield writer.writerow(row + [''] * len(ITEM_FIELDS))
+            continue
+        yield ''.join(
+            writer.writerow(row + [getattr(item, field) for field in ITEM_FIELDS])
+            for item in items
+        )
+
+
+def stream_ndjson(orders):
+    """
+    Yield one JSON object per order, with its items nested, per line.
+    """
+    for order in orders:
+        data = {field: getattr(order, field) for field in ORDER_FIELDS}
+        data['items'] = [
+            {field: getattr(item, field) for field in ITEM_FIELDS}
+            for item in order.items.all()
+        ]
+        yield json.dumps(data, cls=DjangoJSONEncoder) + '\n'
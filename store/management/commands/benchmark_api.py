@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext
+from tests.benchmarks import (
+    SCENARIOS,
+    benchmark_environment,
+    check_response,
+    format_latencies,
+    reset_caches,
+    seed,
+    time_scenario,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the store and users endpoints against a throwaway, "
+        "seeded test database and enforce their query budgets. Run with "
+        "DB_ENGINE=django.db.backends.sqlite3 to benchmark on SQLite."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=200,
+            help='Timed requests per scenario.',
+        )
+        parser.add_argument(
+            '--products',
+            type=int,
+            default=1000,
+            help='Number of products to seed.',
+        )
+
+    def handle(self, *args, **options):
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        runner.setup_test_environment()
+        databases = runner.setup_databases()
+        try:
+            over_budget = self.run_benchmarks(options)
+        finally:
+            runner.teardown_databases(databases)
+            runner.teardown_test_environment()
+        if over_budget:
+            raise CommandError(f"Over query budget: {', '.join(over_budget)}")
+
+    def run_benchmarks(self, options):
+        user = seed(products=options['products'])
+        over_budget = []
+        with benchmark_environment():
+            for scenario_class in SCENARIOS:
+                scenario = scenario_class(user)
+
+                # Count queries cold and inside a transaction, the same
+                # conditions as the query budget test in store.tests
+                scenario.prepare(-1)
+                reset_caches()
+                with transaction.atomic(), \
+                        CaptureQueriesContext(connection) as queries:
+                    check_response(scenario, scenario.run(-1))
+                # Read it now, later requests reset connection.queries
+                query_count = len(queries)
+                if query_count > scenario.budget:
+                    over_budget.append(scenario.name)
+
+                latencies, elapsed = time_scenario(
+                    scenario, options['iterations']
+                    )
+                self.stdout.write(
+                    f"{format_latencies(scenario.name, latencies, elapsed)}  "
+                    f"queries {query_count}/{scenario.budget}"
+                )
+        return over_budget
@@ -0,0 +1,100 @@
+import asyncio
+import time
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, override_settings
+from rest_framework.views import APIView
+from rest_framework_simplejwt.tokens import AccessToken
+from store.cache import CatalogCacheMixin
+from store.models import Product
+from tests.benchmarks import format_latencies
+
+User = get_user_model()
+
+
+def uncached_response(view, handler, request, *args, **kwargs):
+    return handler(request, *args, **kwargs)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the sync DRF read endpoints with their native async "
+        "counterparts under concurrent load inside one ASGI process."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--username',
+            required=True,
+            help='User to authenticate the requests as.',
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=500,
+            help='Requests sent to each endpoint.',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=50,
+            help='Number of requests kept in flight at once.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']} does not exist.")
+        product = Product.objects.order_by('id').first()
+        if product is None:
+            raise CommandError('Seed some products first.')
+
+        endpoints = [
+            ('product list (sync)', '/api/products/'),
+            ('product list (async)', '/api/async/products/'),
+            ('product detail (sync)', f'/api/products/{product.pk}/'),
+            ('product detail (async)', f'/api/async/products/{product.pk}/'),
+            ('order list (sync)', '/api/orders/'),
+            ('order list (async)', '/api/async/orders/'),
+        ]
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+
+        # Measure the views, not the rate limits (the async views run
+        # APIView's throttles too), and have the sync catalog views query
+        # the database on every request as the async ones do
+        with override_settings(ALLOWED_HOSTS=['testserver']), \
+                mock.patch.object(APIView, 'get_throttles', return_value=[]), \
+                mock.patch.object(
+                    CatalogCacheMixin, '_cached_response', uncached_response
+                    ):
+            for name, path in endpoints:
+                latencies, elapsed = asyncio.run(self.run_endpoint(
+                    path, headers, options['requests'], options['concurrency']
+                ))
+                self.stdout.write(format_latencies(name, latencies, elapsed))
+
+    async def run_endpoint(self, path, headers, total, concurrency):
+        """
+        Send ``total`` GETs to ``path`` with ``concurrency`` in flight
+        through Django's ASGI handler; sync views share its single
+        thread-sensitive executor, just as they would under uvicorn.
+        """
+        client = AsyncClient()
+        latencies = []
+        remaining = iter(range(total))
+
+        async def worker():
+            for _ in remaining:
+                started = time.perf_counter()
+                response = await client.get(path, headers=headers)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    raise CommandError(
+                        f'{path} returned {response.status_code}'
+                    )
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return latencies, time.perf_counter() - started
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+from store.models import Product
+from tests.benchmarks import (
+    format_latencies,
+    render_page_with_serializer,
+    render_page_with_values,
+    seed,
+    time_render,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare ProductSerializer with the .values() fast path on product "
+        "pages from a throwaway, seeded test database, and check that both "
+        "render the same bytes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=200,
+            help='Timed pages per path.',
+        )
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=200,
+            help='Products per page.',
+        )
+
+    def handle(self, *args, **options):
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        runner.setup_test_environment()
+        databases = runner.setup_databases()
+        try:
+            self.run_benchmarks(options)
+        finally:
+            runner.teardown_databases(databases)
+            runner.teardown_test_environment()
+
+    def run_benchmarks(self, options):
+        seed(products=options['page_size'])
+        queryset = Product.objects.order_by('id')[:options['page_size']]
+        results = {}
+        for name, render in (
+            ('ProductSerializer', render_page_with_serializer),
+            ('values fast path', render_page_with_values),
+        ):
+            latencies, elapsed, body = time_render(
+                render, queryset, options['iterations']
+                )
+            results[name] = elapsed, body
+            self.stdout.write(format_latencies(name, latencies, elapsed))
+
+        (slow, expected), (fast, body) = results.values()
+        if body != expected:
+            raise CommandError('The fast path rendered different bytes.')
+        self.stdout.write(f'Identical output, {slow / fast:.1f}x faster.')
@@ -0,0 +1,407 @@
+import csv
+import io
+import json
+import random
+import time
+from itertools import accumulate
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from store.cache import bump_catalog_version
+from store.models import (
+    CatalogSequence,
+    Order,
+    OrderItem,
+    Product,
+    summarize_lines,
+)
+from store.rollups import rebuild
+from store.ulid import RANDOM_BITS, encode
+from users.models import Customer
+
+User = get_user_model()
+
+FIRST_NAMES = [
+    'Aoife', 'Ciara', 'Conor', 'Daniel', 'Emma', 'Grace', 'Jack', 'James',
+    'Liam', 'Niamh', 'Noah', 'Oisin', 'Petra', 'Sarah', 'Sean', 'Sophie',
+]
+LAST_NAMES = [
+    'Brennan', 'Byrne', 'Doyle', 'Kelly', 'Murphy', 'Nolan', "O'Brien",
+    'Ryan', 'Smith', 'Walsh',
+]
+TOWNS = ['Cork', 'Dublin', 'Galway', 'Kilkenny', 'Limerick', 'Sligo', 'Waterford']
+COUNTRIES = ['IE', 'IE', 'IE', 'GB', 'FR', 'DE', 'US']
+WORDS = [
+    'Classic', 'Compact', 'Deluxe', 'Eco', 'Handmade', 'Linen', 'Oak',
+    'Organic', 'Travel', 'Vintage', 'Wool', 'Bag', 'Candle', 'Jacket',
+    'Lamp', 'Mug', 'Notebook', 'Scarf', 'Teapot', 'Throw',
+]
+
+
+def parse_distribution(value):
+    """
+    Parse ``"1=50,2=30,3=20"`` into the choices and their cumulative
+    weights, ready for ``Random.choices()``: ([1, 2, 3], [50, 80, 100]).
+    """
+    try:
+        pairs = [part.split('=') for part in value.split(',')]
+        choices = [int(choice) for choice, _ in pairs]
+        weights = [float(weight) for _, weight in pairs]
+    except ValueError:
+        raise CommandError(f"Expected a distribution like 1=50,2=30, got {value!r}")
+    if min(choices) < 1 or min(weights) < 0 or not sum(weights):
+        raise CommandError(f"Invalid distribution {value!r}")
+    return choices, list(accumulate(weights))
+
+
+def price_for(product_id):
+    """
+    A product's price, derived from its id so items can be priced
+    without keeping the catalog in memory.
+    """
+    return Decimal((product_id * 7919) % 19900 + 99) / 100
+
+
+def name_for(product_id):
+    """
+    A product's name, derived from its id like its price.
+    """
+    words = []
+    for _ in range(3):
+        product_id, index = divmod(product_id, len(WORDS))
+        words.append(WORDS[index])
+    return ' '.join(words)
+
+
+class BulkWriter:
+    """
+    Writes rows with multi-row INSERTs, one transaction per chunk.
+
+    Rows are inserted raw, as bulk_create() does but without pre_save(),
+    so the explicit order dates aren't replaced by auto_now_add.
+    """
+
+    batch_size = 1000
+
+    def __init__(self):
+        self.rows_written = 0
+
+    def write(self, model, fields, rows):
+        model_fields = [model._meta.get_field(field) for field in fields]
+        objs = [model(**dict(zip(fields, row))) for row in rows]
+        for start in range(0, len(objs), self.batch_size):
+            model._base_manager._insert(
+                objs[start:start + self.batch_size], model_fields, raw=True
+                )
+        self.rows_written += len(rows)
+
+
+class CopyWriter(BulkWriter):
+    """
+    Writes rows with PostgreSQL's COPY, much faster than INSERTs.
+    """
+
+    def write(self, model, fields, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        # With NULL '\\N', an empty field is an empty string, not NULL.
+        # Booleans go out as True/False, which PostgreSQL accepts.
+        for row in rows:
+            writer.writerow([
+                '\\N' if value is None
+                else json.dumps(value) if isinstance(value, dict)
+                else value
+                for value in row
+            ])
+        buffer.seek(0)
+        columns = ', '.join(
+            connection.ops.quote_name(model._meta.get_field(field).column)
+            for field in fields
+        )
+        sql = (
+            f'COPY {connection.ops.quote_name(model._meta.db_table)} '
+            f"({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+        )
+        with connection.cursor() as cursor:
+            if hasattr(cursor.cursor, 'copy_expert'):
+                cursor.cursor.copy_expert(sql, buffer)
+            else:
+                with cursor.cursor.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+        self.rows_written += len(rows)
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate reproducible synthetic users, customers, products, orders "
+        "and order items in volume, for scale testing. The same --seed and "
+        "options produce the same rows. Rows are written in chunks (COPY on "
+        "PostgreSQL, bulk_create elsewhere), so memory stays flat."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='Random seed.')
+        parser.add_argument(
+            '--products', type=int, default=10000, help='Products to create.'
+        )
+        parser.add_argument(
+            '--customers', type=int, default=10000,
+            help='Users with customer profiles to create.',
+        )
+        parser.add_argument(
+            '--orders', type=int, default=100000, help='Orders to create.'
+        )
+        parser.add_argument(
+            '--guest-ratio', type=float, default=0.3,
+            help='Share of orders placed by guests rather than customers.',
+        )
+        parser.add_argument(
+            '--fulfilled-ratio', type=float, default=0.8,
+            help='Share of orders marked fulfilled.',
+        )
+        parser.add_argument(
+            '--tracked-stock-ratio', type=float, default=0.2,
+            help='Share of products whose stock is tracked.',
+        )
+        parser.add_argument(
+            '--items', default='1=45,2=25,3=15,4=8,6=5,10=2',
+            help='Lines per order as count=weight pairs.',
+        )
+        parser.add_argument(
+            '--quantities', default='1=75,2=15,3=6,5=3,10=1',
+            help='Units per line as quantity=weight pairs.',
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='Spread order dates over this many days before --end.',
+        )
+        parser.add_argument(
+            '--end',
+            help='Latest order date (ISO 8601); defaults to now. Fix it for '
+                 'runs that must match exactly.',
+        )
+        parser.add_argument(
+            '--password', default='password',
+            help='Password for every generated user.',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=10000,
+            help='Rows generated and written per transaction.',
+        )
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Use bulk_create even on PostgreSQL.',
+        )
+        parser.add_argument(
+            '--skip-rollups', action='store_true',
+            help="Don't rebuild the sales rollups for the generated orders.",
+        )
+
+    def handle(self, *args, **options):
+        if not 0 <= options['guest_ratio'] <= 1:
+            raise CommandError('--guest-ratio must be between 0 and 1.')
+        if options['guest_ratio'] < 1 and options['orders'] and not options['customers']:
+            raise CommandError('Claimed orders need --customers.')
+        if options['orders'] and not options['products']:
+            raise CommandError('Orders need --products.')
+        self.lines, self.line_weights = parse_distribution(options['items'])
+        self.quantities, self.quantity_weights = parse_distribution(
+            options['quantities']
+            )
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        self.chunk_size = options['chunk_size']
+        self.end = timezone.now()
+        if options['end']:
+            self.end = parse_datetime(options['end'])
+            if self.end is None:
+                raise CommandError(f"Invalid --end {options['end']!r}")
+            if timezone.is_naive(self.end):
+                self.end = timezone.make_aware(self.end)
+
+        use_copy = connection.vendor == 'postgresql' and not options['no_copy']
+        self.writer = CopyWriter() if use_copy else BulkWriter()
+
+        self.first_id = {
+            model: (model._base_manager.aggregate(top=Max('id'))['top'] or 0) + 1
+            for model in (User, Customer, Product, Order, OrderItem)
+        }
+        self.timed('users and customers', self.generate_customers)
+        self.timed('products', self.generate_products)
+        self.timed('orders and items', self.generate_orders)
+
+        # Both writers insert explicit ids past the sequences' current values
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [User, Customer, Product, Order, OrderItem]
+            )
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+        bump_catalog_version()
+        if options['orders'] and not options['skip_rollups']:
+            days, products = rebuild(
+                timezone.localdate(self.end - timedelta(days=options['days'])),
+                timezone.localdate(self.end),
+                )
+            self.stdout.write(
+                f"Rebuilt {days} daily and {products} product sales rollups."
+            )
+
+    def timed(self, label, generate):
+        written = self.writer.rows_written
+        started = time.perf_counter()
+        generate()
+        elapsed = time.perf_counter() - started
+        rows = self.writer.rows_written - written
+        self.stdout.write(
+            f"{label:<20} {rows:>10} rows  {elapsed:8.1f} s  "
+            f"{rows / elapsed if elapsed else 0:10.0f} rows/s"
+        )
+
+    def chunks(self, count):
+        for start in range(0, count, self.chunk_size):
+            yield range(start, min(start + self.chunk_size, count))
+
+    def generate_customers(self):
+        password = make_password(self.options['password'])
+        first_user = self.first_id[User]
+        first_customer = self.first_id[Customer]
+        now = timezone.now()
+        for chunk in self.chunks(self.options['customers']):
+            users, customers = [], []
+            for n in chunk:
+                user_id = first_user + n
+                users.append((
+                    user_id, f'user{user_id}', f'user{user_id}@example.com',
+                    password, self.rng.choice(FIRST_NAMES),
+                    self.rng.choice(LAST_NAMES), False, False, True, now,
+                ))
+                customers.append((
+                    first_customer + n, user_id,
+                    f'08{self.rng.randrange(10 ** 7, 10 ** 8)}',
+                    f'{self.rng.randrange(1, 200)} Main Street', '',
+                    self.rng.choice(COUNTRIES), '', self.rng.choice(TOWNS),
+                    f'A{self.rng.randrange(10, 99)}',
+                ))
+            with transaction.atomic():
+                self.writer.write(User, (
+                    'id', 'username', 'email', 'password', 'first_name',
+                    'last_name', 'is_staff', 'is_superuser', 'is_active',
+                    'date_joined',
+                ), users)
+                self.writer.write(Customer, (
+                    'id', 'user_id', 'phone_number', 'street_address1',
+                    'street_address2', 'country', 'county', 'town', 'postcode',
+                ), customers)
+
+    def generate_products(self):
+        first = self.first_id[Product]
+        now = timezone.now()
+        for chunk in self.chunks(self.options['products']):
+            rows = []
+            with transaction.atomic():
+                seqs = iter(CatalogSequence.allocate(len(chunk)))
+                for n in chunk:
+                    product_id = first + n
+                    stock = None
+                    if self.rng.random() < self.options['tracked_stock_ratio']:
+                        stock = self.rng.randrange(0, 500)
+                    rows.append((
+                        product_id,
+                        name_for(product_id),
+                        f'Synthetic product {product_id}.',
+                        price_for(product_id), stock, now, next(seqs),
+                    ))
+                self.writer.write(Product, (
+                    'id', 'name', 'description', 'price', 'stock',
+                    'modified_at', 'change_seq',
+                ), rows)
+
+    def pick_product(self):
+        # Squaring skews sales towards the low ids, so a few products
+        # sell far more than the rest, as in a real catalog
+        first = self.first_id[Product]
+        return first + int(self.options['products'] * self.rng.random() ** 2)
+
+    def order_number(self, date):
+        # A ULID for the order date, with seeded rather than secret
+        # randomness so runs repeat exactly
+        ms = int(date.timestamp() * 1000)
+        return encode((ms << RANDOM_BITS) | self.rng.getrandbits(RANDOM_BITS))
+
+    def generate_orders(self):
+        options = self.options
+        first_order = self.first_id[Order]
+        next_item = self.first_id[OrderItem]
+        first_customer = self.first_id[Customer]
+        first_user = self.first_id[User]
+        span = timedelta(days=options['days'])
+        start = self.end - span
+        for chunk in self.chunks(options['orders']):
+            orders, items = [], []
+            for n in chunk:
+                order_id = first_order + n
+                # Dates rise with the id, as they do for real orders
+                date = start + span * ((n + self.rng.random()) / options['orders'])
+                customer_id = None
+                email = f'guest{order_id}@example.com'
+                if self.rng.random() >= options['guest_ratio']:
+                    index = self.rng.randrange(options['customers'])
+                    customer_id = first_customer + index
+                    email = f'user{first_user + index}@example.com'
+
+                line_count = min(
+                    self.rng.choices(self.lines, cum_weights=self.line_weights)[0],
+                    options['products'],
+                    )
+                bag = {}
+                while len(bag) < line_count:
+                    bag.setdefault(self.pick_product(), self.rng.choices(
+                        self.quantities, cum_weights=self.quantity_weights
+                        )[0])
+                order_total = Decimal(0)
+                for product_id, quantity in bag.items():
+                    item_total = price_for(product_id) * quantity
+                    order_total += item_total
+                    items.append((next_item, order_id, product_id, quantity, item_total))
+                    next_item += 1
+                item_count, line_summary = summarize_lines(
+                    [(name_for(pk), quantity) for pk, quantity in bag.items()]
+                    )
+                delivery_cost = Order.calculate_delivery(order_total)
+                status = 'unfulfilled'
+                if self.rng.random() < options['fulfilled_ratio']:
+                    status = 'fulfilled'
+                orders.append((
+                    order_id, self.order_number(date), customer_id,
+                    self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES),
+                    email, f'08{self.rng.randrange(10 ** 7, 10 ** 8)}',
+                    f'{self.rng.randrange(1, 200)} Main Street', None,
+                    self.rng.choice(COUNTRIES), self.rng.choice(TOWNS), None,
+                    f'A{self.rng.randrange(10, 99)}', date, delivery_cost,
+                    {str(pk): quantity for pk, quantity in bag.items()},
+                    order_total, order_total + delivery_cost, '', status,
+                    item_count, line_summary,
+                ))
+            with transaction.atomic():
+                self.write_orders(orders)
+                self.writer.write(OrderItem, (
+                    'id', 'order_id', 'product_id', 'quantity', 'item_total',
+                ), items)
+
+    def write_orders(self, rows):
+        fields = (
+            'id', 'order_number', 'customer_id', 'first_name', 'last_name',
+            'email', 'phone_number', 'street_address1', 'street_address2',
+            'country', 'town', 'county', 'postcode', 'date', 'delivery_cost',
+            'bag', 'order_total', 'total_price', 'stripe_pid', 'status',
+            'item_count', 'line_summary',
+        )
+        self.writer.write(Order, fields, rows)
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from store.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the daily sales rollups from the orders, for backfills "
+        "and after line edits made outside checkout. Without dates every "
+        "day is rebuilt."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date-from',
+            help='First order date to rebuild (YYYY-MM-DD).',
+        )
+        parser.add_argument(
+            '--date-to',
+            help='Last order date to rebuild (YYYY-MM-DD).',
+        )
+
+    def handle(self, *args, **options):
+        days, products = rebuild(options['date_from'], options['date_to'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {days} day rows and {products} product rows."
+        ))
@@ -0,0 +1,54 @@
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db.models import Sum, Value
+from django.db.models.functions import Coalesce
+from store.models import Order
+
+
+class Command(BaseCommand):
+    help = (
+        "Check the incrementally maintained order totals against a full "
+        "aggregate of their items, optionally fixing any drift."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Rewrite the totals of orders that do not match.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Number of orders fetched per database round trip.',
+        )
+
+    def handle(self, *args, **options):
+        orders = (
+            Order.objects
+            .only('id', 'order_number', *Order.TOTAL_FIELDS)
+            .annotate(items_total=Coalesce(
+                Sum('items__item_total'), Value(Decimal('0'))
+                ))
+            .order_by('id')
+        )
+        checked = mismatched = 0
+        for order in orders.iterator(chunk_size=options['chunk_size']):
+            checked += 1
+            stored = [getattr(order, field) for field in Order.TOTAL_FIELDS]
+            order.set_totals(order.items_total)
+            expected = [getattr(order, field) for field in Order.TOTAL_FIELDS]
+            if stored == expected:
+                continue
+            mismatched += 1
+            self.stdout.write(
+                f"{order.order_number}: stored {stored}, expected {expected}"
+            )
+            if options['fix']:
+                order.save(update_fields=Order.TOTAL_FIELDS)
+
+        action = 'fixed' if options['fix'] else 'found'
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {checked} orders, {action} {mismatched} mismatched."
+        ))
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.17 on 2026-10-18 01:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0003_rename_user_profile_order_customer'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('customer__isnull', True)), fields=['email'], name='order_unclaimed_email_idx'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+import json
+from django.db import migrations, models
+
+
+def bag_text_to_json(apps, schema_editor):
+    Order = apps.get_model('store', 'Order')
+    batch = []
+    for order in Order.objects.only('id', 'bag').iterator(chunk_size=2000):
+        try:
+            order.bag_data = json.loads(order.bag) if order.bag else {}
+        except ValueError:
+            # Keep anything unparseable rather than dropping it
+            order.bag_data = order.bag
+        batch.append(order)
+        if len(batch) == 2000:
+            Order.objects.bulk_update(batch, ['bag_data'])
+            batch = []
+    Order.objects.bulk_update(batch, ['bag_data'])
+
+
+def bag_json_to_text(apps, schema_editor):
+    Order = apps.get_model('store', 'Order')
+    batch = []
+    for order in Order.objects.only('id', 'bag_data').iterator(chunk_size=2000):
+        order.bag = json.dumps(order.bag_data) if order.bag_data else ''
+        batch.append(order)
+        if len(batch) == 2000:
+            Order.objects.bulk_update(batch, ['bag'])
+            batch = []
+    Order.objects.bulk_update(batch, ['bag'])
+
+
+def create_bag_gin_index(apps, schema_editor):
+    # GIN only exists on PostgreSQL, so it isn't declared in Order.Meta
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX order_bag_gin_idx ON store_order USING gin (bag)'
+        )
+
+
+def drop_bag_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS order_bag_gin_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0004_order_unclaimed_email_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='bag_data',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.RunPython(bag_text_to_json, bag_json_to_text),
+        migrations.RemoveField(
+            model_name='order',
+            name='bag',
+        ),
+        migrations.RenameField(
+            model_name='order',
+            old_name='bag_data',
+            new_name='bag',
+        ),
+        migrations.RunPython(create_bag_gin_index, drop_bag_gin_index),
+    ]
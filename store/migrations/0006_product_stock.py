@@ -0,0 +1,33 @@
+from django.db import migrations, models
+
+
+def in_stock_to_stock(apps, schema_editor):
+    # Real counts aren't known yet: products that were out of stock start
+    # at 0 and the rest stay untracked (NULL) until counts are loaded.
+    Product = apps.get_model('store', 'Product')
+    Product.objects.filter(in_stock=False).update(stock=0)
+
+
+def stock_to_in_stock(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    Product.objects.filter(stock=0).update(in_stock=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0005_order_bag_jsonfield'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='stock',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(in_stock_to_stock, stock_to_in_stock),
+        migrations.RemoveField(
+            model_name='product',
+            name='in_stock',
+        ),
+    ]
@@ -0,0 +1,56 @@
+from django.db import migrations, models
+
+
+def number_existing_products(apps, schema_editor):
+    # Put the current catalog in the change feed in id order, so a first
+    # sync from token 0 returns every product.
+    Product = apps.get_model('store', 'Product')
+    CatalogSequence = apps.get_model('store', 'CatalogSequence')
+    seq = 0
+    batch = []
+    for product in Product.objects.only('id').order_by('id').iterator(chunk_size=2000):
+        seq += 1
+        product.change_seq = seq
+        batch.append(product)
+        if len(batch) == 2000:
+            Product.objects.bulk_update(batch, ['change_seq'])
+            batch = []
+    Product.objects.bulk_update(batch, ['change_seq'])
+    CatalogSequence.objects.create(pk=1, value=seq)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0006_product_stock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProductTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_id', models.PositiveBigIntegerField()),
+                ('change_seq', models.PositiveBigIntegerField(unique=True)),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='change_seq',
+            field=models.PositiveBigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='modified_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(number_existing_products, migrations.RunPython.noop),
+    ]
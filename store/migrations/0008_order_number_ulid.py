@@ -0,0 +1,18 @@
+from django.db import migrations, models
+
+
+# Existing orders keep the uuid4 order numbers customers already have;
+# only new orders get ULIDs.
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0007_product_change_feed'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='order_number',
+            field=models.CharField(editable=False, max_length=32, unique=True),
+        ),
+    ]
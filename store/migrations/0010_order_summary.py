@@ -0,0 +1,61 @@
+from django.db import migrations, models
+
+
+def summarize_lines(lines, limit=3, max_length=255):
+    # A copy of store.models.summarize_lines as it stood for this migration
+    lines = sorted(lines, key=lambda line: (-line[1], line[0]))
+    shown = lines[:limit]
+    while True:
+        summary = ', '.join(f'{quantity} × {name}' for name, quantity in shown)
+        if len(lines) > len(shown):
+            summary += f' and {len(lines) - len(shown)} more'
+        if len(summary) <= max_length or len(shown) == 1:
+            break
+        shown = shown[:-1]
+    return sum(quantity for _, quantity in lines), summary[:max_length]
+
+
+def summarize_orders(apps, schema_editor):
+    Order = apps.get_model('store', 'Order')
+    OrderItem = apps.get_model('store', 'OrderItem')
+    batch = []
+    orders = Order.objects.only('id').order_by('id')
+    for order in orders.iterator(chunk_size=2000):
+        batch.append(order)
+        if len(batch) == 2000:
+            summarize_batch(Order, OrderItem, batch)
+            batch = []
+    summarize_batch(Order, OrderItem, batch)
+
+
+def summarize_batch(Order, OrderItem, orders):
+    lines = {order.pk: [] for order in orders}
+    items = OrderItem.objects.filter(order_id__in=list(lines)).values_list(
+        'order_id', 'product__name', 'quantity'
+        )
+    for order_id, name, quantity in items:
+        lines[order_id].append((name, quantity))
+    for order in orders:
+        order.item_count, order.line_summary = summarize_lines(lines[order.pk])
+    Order.objects.bulk_update(orders, ['item_count', 'line_summary'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='line_summary',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(summarize_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+def mark_unnumbered_products_pending(apps, schema_editor):
+    # Products left on the old default of 0 never reached the change
+    # feed; NULL now marks them for CatalogSequence.renumber()
+    Product = apps.get_model('store', 'Product')
+    Product.objects.filter(change_seq=0).update(change_seq=None)
+
+
+def mark_pending_products_unnumbered(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    Product.objects.filter(change_seq__isnull=True).update(change_seq=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_order_summary'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='change_seq',
+            field=models.PositiveBigIntegerField(db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(
+            mark_unnumbered_products_pending, mark_pending_products_unnumbered
+        ),
+    ]
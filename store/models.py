@@ -1,16 +1,253 @@
-import uuid
-from django.db import models
-from django.db.models import Sum
+from typing import NamedTuple
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import models, transaction
+from django.db.models import Case, F, Max, Q, Sum, Value, When
+from django.db.models.functions import Round
 from django.conf import settings
+from django.core.cache import cache
+from django.dispatch import Signal
+from django.utils.functional import cached_property
 from django_countries.fields import CountryField
 from users.models import Customer
+from .cache import guest_orders_key
+from .ulid import new_ulid
 
 # Create your models here.
+class CatalogSequence(models.Model):
+    """
+    Single-row counter handing out the catalog's change sequence numbers.
+
+    Allocating updates the row, which holds its lock until the surrounding
+    transaction ends, so sequence numbers commit in the order they were
+    handed out and a sync client that has seen N can never miss a change
+    numbered below N that commits later.
+
+    Product edits and stock reservations don't allocate in their own
+    transaction, which would serialise every checkout on this row until
+    it commits. They mark the products pending instead, with a NULL
+    ``change_seq`` written in the same transaction, and renumber() numbers
+    every pending product after the commit, in short transactions of its
+    own (renumber_on_commit()). Readers of the feed renumber too, so rows
+    whose hook never ran are still numbered.
+    """
+    ROW_ID = 1
+    RENUMBER_BATCH = 1000
+
+    value = models.PositiveBigIntegerField(default=0)
+
+    @classmethod
+    def allocate(cls, count=1):
+        """
+        Reserve ``count`` consecutive sequence numbers. Must run inside a
+        transaction, after locking any product rows it is for.
+
+        Returns:
+            range: The reserved numbers.
+        """
+        if not cls.objects.filter(pk=cls.ROW_ID).update(value=F('value') + count):
+            # First use, or the table was flushed: carry on from the
+            # highest number already handed out
+            highest = max(
+                Product.objects.aggregate(seq=Max('change_seq'))['seq'] or 0,
+                ProductTombstone.objects.aggregate(seq=Max('change_seq'))['seq'] or 0,
+            )
+            cls.objects.create(pk=cls.ROW_ID, value=highest + count)
+        value = cls.objects.values_list('value', flat=True).get(pk=cls.ROW_ID)
+        return range(value - count + 1, value + 1)
+
+    @classmethod
+    def renumber_on_commit(cls):
+        """
+        Number the pending products once the current transaction commits.
+
+        Register it before any catalog version bump for the same change,
+        so the price table never sees the new version before the new
+        numbers. A failure is logged rather than raised, so the callbacks
+        after it still run; the products stay pending until the next
+        renumber().
+        """
+        transaction.on_commit(cls.renumber, robust=True)
+
+    @classmethod
+    def renumber(cls):
+        """
+        Give every pending product a sequence number, locking them before
+        the sequence like every other allocation.
+
+        Works through RENUMBER_BATCH products per transaction. Products
+        another renumber() has locked are skipped, as it numbers them.
+        """
+        while True:
+            with transaction.atomic():
+                ids = list(
+                    Product.objects.select_for_update(skip_locked=True)
+                    .filter(change_seq__isnull=True)
+                    .order_by('pk')
+                    .values_list('pk', flat=True)[:cls.RENUMBER_BATCH]
+                )
+                if not ids:
+                    return
+                Product.objects.filter(pk__in=ids).update(change_seq=Case(
+                    *[When(pk=pk, then=Value(seq)) for pk, seq in zip(
+                        ids, cls.allocate(len(ids))
+                    )],
+                    output_field=models.PositiveBigIntegerField(),
+                ))
+            if len(ids) < cls.RENUMBER_BATCH:
+                return
+
+
+class ProductQuerySet(models.QuerySet):
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """
+        Number the new products in the change feed, which save() would
+        otherwise do.
+        """
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            for product, seq in zip(objs, CatalogSequence.allocate(len(objs))):
+                product.change_seq = seq
+            return super().bulk_create(objs, *args, **kwargs)
+
+    def update(self, **kwargs):
+        """
+        Mark the updated products pending and renumber them once the
+        transaction commits, which save() would otherwise do. Setting
+        ``change_seq`` directly skips this.
+        """
+        if 'change_seq' in kwargs:
+            return super().update(**kwargs)
+        rows = super().update(change_seq=None, **kwargs)
+        CatalogSequence.renumber_on_commit()
+        return rows
+
+
 class Product(models.Model):
+    """
+    A catalog product.
+
+    Every write, through save() or a queryset update(), marks the product
+    pending with a NULL ``change_seq`` and moves it to the head of the
+    catalog change feed once it commits; deletions leave a
+    ProductTombstone in the feed instead.
+    """
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
-    in_stock = models.BooleanField(default=True)
+    # Units available to sell. NULL means stock isn't tracked for the
+    # product, so it never runs out.
+    stock = models.PositiveIntegerField(null=True, blank=True)
+    modified_at = models.DateTimeField(auto_now=True)
+    # NULL while the product waits for a number (CatalogSequence.renumber)
+    change_seq = models.PositiveBigIntegerField(
+        null=True, editable=False, db_index=True
+        )
+
+    objects = ProductQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'modified_at', 'change_seq'}
+        self.change_seq = None
+        with transaction.atomic():
+            # Registered ahead of the post_save version bump
+            CatalogSequence.renumber_on_commit()
+            super().save(*args, **kwargs)
+
+    @staticmethod
+    def is_in_stock(stock):
+        return stock is None or stock > 0
+
+    @property
+    def in_stock(self):
+        return self.is_in_stock(self.stock)
+
+
+class ProductTombstone(models.Model):
+    """
+    A deleted product's entry in the catalog change feed.
+    """
+    product_id = models.PositiveBigIntegerField()
+    change_seq = models.PositiveBigIntegerField(unique=True)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+
+class BagLine(NamedTuple):
+    product_id: int
+    quantity: int
+
+
+class OrderQuerySet(models.QuerySet):
+
+    def with_bag(self):
+        """
+        Load the bag column, which the default manager defers, keeping
+        any other only() or defer() already applied.
+        """
+        field_names, deferred = self.query.deferred_loading
+        if not deferred:
+            return self.only(*field_names, 'bag')
+        return self.defer(None).defer(*(field_names - {'bag'}))
+
+    def containing_product(self, product_id):
+        """
+        Orders whose bag holds the given product. Served by a GIN index
+        on PostgreSQL.
+        """
+        return self.filter(bag__has_key=str(product_id))
+
+
+class OrderManager(models.Manager.from_queryset(OrderQuerySet)):
+
+    def get_queryset(self):
+        # The bag can be large and is rarely needed, so keep it out of
+        # queries unless asked for with with_bag() or on first access.
+        return super().get_queryset().defer('bag')
+
+
+def summarize_lines(lines, limit=3, max_length=255):
+    """
+    Count the units in an order's lines and describe them briefly.
+
+    Args:
+        lines (list): (product name, quantity) pairs.
+        limit (int): Most lines to name; the rest are counted.
+        max_length (int): Longest summary to return.
+
+    Returns:
+        tuple: The unit count and a summary such as
+        "2 × Oak Lamp, 1 × Wool Scarf and 3 more", largest lines first.
+    """
+    lines = sorted(lines, key=lambda line: (-line[1], line[0]))
+    return (
+        sum(quantity for _, quantity in lines),
+        describe_lines(lines[:limit], len(lines), max_length),
+    )
+
+
+def describe_lines(shown, line_count, max_length=255):
+    """
+    The summary naming the ``shown`` lines of an order with
+    ``line_count`` lines, dropping names until it fits ``max_length``.
+
+    Args:
+        shown (list): The largest (product name, quantity) pairs, largest
+            first.
+        line_count (int): How many lines the order has.
+        max_length (int): Longest summary to return.
+
+    Returns:
+        str: The summary.
+    """
+    while True:
+        summary = ', '.join(f'{quantity} × {name}' for name, quantity in shown)
+        if line_count > len(shown):
+            summary += f' and {line_count - len(shown)} more'
+        if len(summary) <= max_length or len(shown) <= 1:
+            return summary[:max_length]
+        shown = shown[:-1]
 
 
 class Order(models.Model):
@@ -19,7 +256,8 @@ class Order(models.Model):
     and link to the user profile.
 
     Attributes:
-        order_number (str): Unique identifier for the order.
+        order_number (str): Unique, time-ordered identifier (a ULID).
+            Orders placed before ULIDs keep their uuid4 hex numbers.
         customer (ForeignKey): Link to the user profile.
         first_name (str): First name of the user.
         last_name (str): Last name of the user.
@@ -33,11 +271,14 @@ class Order(models.Model):
         postcode (str): Postcode of the user.
         date (datetime): Date and time of the order.
         delivery_cost (Decimal): Cost of delivery.
-        bag (str): JSON string of the items in the order.
+        bag (dict): Quantities in the original cart keyed by product id.
         order_total (Decimal): Total cost of the items in the order.
         total_price (Decimal): Total price of the order including delivery.
         stripe_pid (str): Stripe payment ID.
         status (str): Status of the order (unfulfilled or fulfilled).
+        item_count (int): Units across all lines, kept with the lines.
+        line_summary (str): Short description of the lines, such as
+            "2 × Oak Lamp, 1 × Wool Scarf and 3 more", kept with the lines.
         """
 
     STATUS_CHOICES = [
@@ -45,7 +286,12 @@ class Order(models.Model):
         ('fulfilled', 'Fulfilled'),
     ]
 
-    order_number = models.CharField(max_length=32, null=False, editable=False)
+    order_number = models.CharField(
+        max_length=32,
+        null=False,
+        editable=False,
+        unique=True
+        )
     customer = models.ForeignKey(
         Customer,
         on_delete=models.SET_NULL,
@@ -69,7 +315,7 @@ class Order(models.Model):
         decimal_places=2,
         default=0.00
         )
-    bag = models.TextField(null=False, blank=False, default='')
+    bag = models.JSONField(default=dict, blank=True)
     order_total = models.DecimalField(
         max_digits=10,
         decimal_places=2,
@@ -91,38 +337,274 @@ class Order(models.Model):
         choices=STATUS_CHOICES,
         default='unfulfilled',
     )
+    item_count = models.PositiveIntegerField(default=0, editable=False)
+    line_summary = models.CharField(
+        max_length=255,
+        blank=True,
+        default='',
+        editable=False
+        )
+
+    objects = OrderManager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['email'],
+                condition=Q(customer__isnull=True),
+                name='order_unclaimed_email_idx',
+            ),
+        ]
 
     def _generate_order_number(self):
         """
-        Generate a random, unique order number using UUID
+        Generate a unique, time-ordered order number (a ULID)
+        """
+        return new_ulid()
+
+    @cached_property
+    def bag_lines(self):
+        """
+        The bag as typed lines, decoded on first access.
+
+        Bags migrated from the old text column may hold a list of
+        [product id, quantity] pairs or {product, quantity} objects, or
+        the unparseable text itself. Lists are read as far as they make
+        sense; anything else has no lines.
         """
-        return uuid.uuid4().hex.upper()
+        bag = self.bag
+        if isinstance(bag, dict):
+            entries = bag.items()
+        elif isinstance(bag, list):
+            entries = []
+            for entry in bag:
+                if isinstance(entry, dict):
+                    entry = (
+                        entry.get('product', entry.get('product_id')),
+                        entry.get('quantity'),
+                        )
+                if isinstance(entry, (list, tuple)) and len(entry) == 2:
+                    entries.append(entry)
+        else:
+            entries = []
+        lines = []
+        for product_id, quantity in entries:
+            try:
+                lines.append(BagLine(int(product_id), int(quantity)))
+            except (TypeError, ValueError):
+                continue
+        return lines
+
+    TOTAL_FIELDS = ['order_total', 'delivery_cost', 'total_price']
 
     def update_total(self):
         """
-        Update grand total each time an item is added,
-        accounting for delivery costs.
+        Recalculate the totals from a full aggregate over the items and
+        write only the total columns. Used to reconcile the incrementally
+        maintained totals; regular edits go through adjust_totals().
         """
-        self.order_total = self.items.aggregate(Sum('item_total'))[
+        self.set_totals(self.items.aggregate(Sum('item_total'))[
             'item_total__sum'
-            ] or 0
-        if self.order_total < settings.FREE_DELIVERY_THRESHOLD:
+            ] or 0)
+        self.save(update_fields=self.TOTAL_FIELDS)
+
+    @staticmethod
+    def calculate_delivery(order_total):
+        """
+        Return the delivery cost for an order total.
+        """
+        if order_total < settings.FREE_DELIVERY_THRESHOLD:
             sdp = settings.STANDARD_DELIVERY_PERCENTAGE
-            self.delivery_cost = self.order_total * sdp / 100
-        else:
-            self.delivery_cost = 0
+            return (Decimal(order_total) * sdp / 100).quantize(
+                Decimal('0.01'), rounding=ROUND_HALF_UP
+                )
+        return Decimal('0.00')
+
+    def set_totals(self, order_total):
+        """
+        Set the order total, delivery cost and total price in memory
+        from the sum of the item totals, without saving.
+        """
+        self.order_total = Decimal(order_total).quantize(Decimal('0.01'))
+        self.delivery_cost = self.calculate_delivery(self.order_total)
         self.total_price = self.order_total + self.delivery_cost
-        self.save()
+
+    def adjust_totals(self, delta, refresh=True):
+        """
+        Shift the order total by ``delta`` with a single atomic UPDATE.
+
+        The new totals are computed by the database from the stored
+        values, so concurrent line edits can't overwrite each other and
+        the cost of an edit doesn't depend on how many items the order
+        has. Only the total columns are written, and unless ``refresh``
+        is False they are read back onto this instance afterwards.
+        """
+        delta = Decimal(delta)
+        if not delta:
+            return
+        order_total = F('order_total') + delta
+        delivery_cost = Case(
+            When(
+                order_total__lt=settings.FREE_DELIVERY_THRESHOLD - delta,
+                # A decimal rate, or SQLite divides integer totals as
+                # integers
+                then=Round(
+                    order_total
+                    * (Decimal(settings.STANDARD_DELIVERY_PERCENTAGE) / 100),
+                    2
+                    ),
+            ),
+            default=Value(Decimal('0.00')),
+            output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        )
+        updated = Order.objects.filter(pk=self.pk).update(
+            order_total=order_total,
+            delivery_cost=delivery_cost,
+            total_price=order_total + delivery_cost,
+        )
+        if updated and refresh:
+            self.refresh_from_db(fields=self.TOTAL_FIELDS)
+
+    def set_summary(self, lines):
+        """
+        Set the item count and line summary in memory, without saving.
+
+        Args:
+            lines (list): (product name, quantity) pairs.
+        """
+        self.item_count, self.line_summary = summarize_lines(lines)
+
+    def update_summary(self, old, new, limit=3):
+        """
+        Apply one line edit to the item count and line summary, writing
+        only those columns. Checkout sets them from the lines it creates;
+        this covers edits made to the lines afterwards.
+
+        Like adjust_totals(), the item count is shifted by the edit's
+        difference in the database. The summary only names the largest
+        lines, so it is rebuilt from those few lines and the line count,
+        and only when the edit changes a product or quantity.
+
+        Args:
+            old (tuple): The line's (product id, quantity, item total)
+                before the edit, or None for a new line.
+            new (tuple): The same after the edit, or None for a removed
+                line.
+            limit (int): Most lines the summary names.
+        """
+        if old and new and old[:2] == new[:2]:
+            return
+        delta = (new[1] if new else 0) - (old[1] if old else 0)
+        changes = {'item_count': F('item_count') + delta}
+        shown = list(
+            self.items.order_by('-quantity', 'product__name')
+            .values_list('product__name', 'quantity')[:limit + 1]
+        )
+        line_count = len(shown)
+        if line_count > limit:
+            line_count = self.items.count()
+        changes['line_summary'] = describe_lines(shown[:limit], line_count)
+        Order.objects.filter(pk=self.pk).update(**changes)
+        if 'item_count' in self.__dict__:
+            self.item_count += delta
+        self.line_summary = changes['line_summary']
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored status so a change can be moved between
+        # status buckets in the sales rollups
+        instance._saved_status = instance.__dict__.get('status')
+        return instance
 
     def save(self, *args, **kwargs):
         if not self.order_number:
             self.order_number = self._generate_order_number()
-        super().save(*args, **kwargs)
+        if self._state.adding and self.customer_id is None and self.email:
+            # A new guest order has to be picked up by the owner's next
+            # login. Clear the flag once the order is visible, or a login
+            # in between could claim without it and set the flag again.
+            key = guest_orders_key(self.email)
+            transaction.on_commit(lambda: cache.delete(key))
+        # Keep the order and its rollup update (a post_save receiver)
+        # in one transaction, without a savepoint inside checkout
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+        self._saved_status = self.status
 
     def __str__(self):
         return self.order_number
 
 
+class DailySales(models.Model):
+    """
+    Sales per day and order status, maintained as orders are placed,
+    change status or are deleted.
+
+    Attributes:
+        date (date): The order date.
+        status (str): The orders' status.
+        orders (int): Number of orders.
+        units (int): Units sold across their lines.
+        order_total (Decimal): Sum of the orders' item totals.
+        delivery_cost (Decimal): Sum of their delivery costs.
+        total_price (Decimal): Sum of their total prices.
+    """
+    date = models.DateField()
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    orders = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    order_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    delivery_cost = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_price = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'status'],
+                name='dailysales_date_status_uniq',
+            ),
+        ]
+
+
+class DailyProductSales(models.Model):
+    """
+    Sales of one product per day and order status, maintained alongside
+    DailySales.
+
+    Attributes:
+        date (date): The order date.
+        product (ForeignKey): The product sold.
+        status (str): The orders' status.
+        orders (int): Number of orders with the product.
+        units (int): Units sold.
+        revenue (Decimal): Sum of the lines' item totals.
+    """
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    orders = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'product', 'status'],
+                name='dailyproductsales_date_product_status_uniq',
+            ),
+        ]
+
+
+# Sent when a saved or deleted OrderItem changes an order's lines, after
+# the order's totals are adjusted, with ``order`` (its totals current) and
+# the line's ``old`` and ``new`` (product id, quantity, item total); either
+# is None when the line didn't exist on that side. ``deleted_product`` is
+# set to the product's id when the line goes because its product is being
+# deleted. Checkout's bulk-created lines don't send it.
+order_line_changed = Signal()
+
+
 class OrderItem(models.Model):
     """
     OrderItem model to store individual items in an order.
@@ -144,13 +626,55 @@ class OrderItem(models.Model):
     quantity = models.IntegerField(null=False, blank=False, default=0)
     item_total = models.DecimalField(max_digits=10, decimal_places=2)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the order was last credited with so that save()
+        # and deletion only apply the difference to the order totals.
+        instance._saved_order_id = instance.__dict__.get('order_id')
+        instance._saved_item_total = instance.__dict__.get('item_total')
+        instance._saved_product_id = instance.__dict__.get('product_id')
+        instance._saved_quantity = instance.__dict__.get('quantity')
+        return instance
+
+    def saved_line(self):
+        """
+        The line as last saved: (product id, quantity, item total).
+        """
+        return (
+            getattr(self, '_saved_product_id', self.product_id),
+            getattr(self, '_saved_quantity', self.quantity),
+            getattr(self, '_saved_item_total', self.item_total) or 0,
+        )
+
     def save(self, *args, **kwargs):
         """
         Override the original save method to set the item total
-        and update the order total.
+        and apply the change to the order totals.
         """
         self.item_total = self.product.price * self.quantity
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            previous_order_id = getattr(self, '_saved_order_id', None)
+            old = self.saved_line() if previous_order_id else None
+            if previous_order_id and previous_order_id != self.order_id:
+                previous = Order.objects.get(pk=previous_order_id)
+                previous.adjust_totals(-old[2])
+                order_line_changed.send(
+                    sender=OrderItem, order=previous, old=old, new=None
+                    )
+                old = None
+            self.order.adjust_totals(self.item_total - (old[2] if old else 0))
+            order_line_changed.send(
+                sender=OrderItem,
+                order=self.order,
+                old=old,
+                new=(self.product_id, self.quantity, self.item_total),
+                )
+        self._saved_order_id = self.order_id
+        self._saved_item_total = self.item_total
+        self._saved_product_id = self.product_id
+        self._saved_quantity = self.quantity
 
     def __str__(self):
         return f"{self.order.order_number} - {self.product.name}"
@@ -0,0 +1,27 @@
+from rest_framework.pagination import CursorPagination
+
+
+class ProductCursorPagination(CursorPagination):
+    """
+    Keyset pagination for the product catalog.
+
+    Pages are addressed by an opaque cursor over the primary key rather
+    than an OFFSET, so fetching a deep page costs the same indexed range
+    scan as fetching the first one. Clients may request a smaller or
+    larger page with ``?page_size=``, capped at ``max_page_size``.
+    """
+    ordering = 'id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class OrderCursorPagination(CursorPagination):
+    """
+    Keyset pagination for order history, newest first. Order ids rise
+    with the order date.
+    """
+    ordering = '-id'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -0,0 +1,188 @@
+"""
+Cart pricing without touching the order tables.
+
+quote() prices a cart with the same rules checkout applies, reading
+prices from an in-process PriceTable rather than the database. The table
+is loaded once per process and kept current from the catalog change feed:
+whenever the catalog version in the cache has moved, or PRICE_TABLE_MAX_AGE
+seconds have passed since the last check, the products and tombstones
+numbered after the last change it applied, and any products still
+waiting for a number, are read and merged in. The
+age limit covers version bumps made on other workers that a per-process
+cache never sees. A quote against an unchanged catalog runs no queries
+within that window.
+"""
+import threading
+import time
+from decimal import Decimal
+from django.conf import settings
+from django.db.models import Q
+from typing import NamedTuple
+from rest_framework.exceptions import ValidationError
+from .cache import get_catalog_version
+from .models import Order, Product, ProductTombstone
+
+
+class PriceEntry(NamedTuple):
+    price: Decimal
+    # None when the product's stock isn't tracked
+    stock: int
+
+
+class QuoteLine(NamedTuple):
+    product_id: int
+    quantity: int
+    unit_price: Decimal
+    line_total: Decimal
+
+
+class Quote(NamedTuple):
+    lines: list
+    order_total: Decimal
+    delivery_cost: Decimal
+    total_price: Decimal
+
+    def as_dict(self):
+        """
+        The API representation, money as two-decimal strings like the
+        serializers render it. Built directly, as quotes are hot enough
+        for serializer field setup to dominate their cost.
+        """
+        return {
+            'lines': [
+                {
+                    'product': line.product_id,
+                    'quantity': line.quantity,
+                    'unit_price': f'{line.unit_price:.2f}',
+                    'line_total': f'{line.line_total:.2f}',
+                }
+                for line in self.lines
+            ],
+            'order_total': f'{self.order_total:.2f}',
+            'delivery_cost': f'{self.delivery_cost:.2f}',
+            'total_price': f'{self.total_price:.2f}',
+        }
+
+
+class PriceTable:
+    """
+    Process-wide map of product id to price and stock.
+
+    Readers take a reference to the current dict and never see it change;
+    refreshes build a new dict and swap it in under a lock.
+
+    Attributes:
+        entries (dict): PriceEntry by product id.
+        version: The catalog version the entries were checked against.
+        checked_at (float): Monotonic time of that check.
+        change_seq (int): The last catalog change applied.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.entries = {}
+        self.version = None
+        self.checked_at = None
+        self.change_seq = 0
+
+    def current(self):
+        """
+        Return the entries, first catching up with the catalog if its
+        version has moved since the last check or the check is older than
+        PRICE_TABLE_MAX_AGE.
+        """
+        version = get_catalog_version()
+        if version == self.version and not self.is_stale():
+            return self.entries
+        with self.lock:
+            if version != self.version or self.is_stale():
+                self.refresh()
+                self.version = version
+                self.checked_at = time.monotonic()
+            return self.entries
+
+    def is_stale(self):
+        return (
+            self.checked_at is None
+            or time.monotonic() - self.checked_at > settings.PRICE_TABLE_MAX_AGE
+        )
+
+    def refresh(self):
+        # Pending products have no number yet, so they are read on every
+        # refresh until they get one
+        rows = list(
+            Product.objects
+            .filter(Q(change_seq__gt=self.change_seq) | Q(change_seq__isnull=True))
+            .values_list('id', 'price', 'stock', 'change_seq')
+        )
+        deleted = []
+        if self.change_seq:
+            deleted = list(
+                ProductTombstone.objects
+                .filter(change_seq__gt=self.change_seq)
+                .values_list('product_id', 'change_seq')
+            )
+        entries = dict(self.entries)
+        change_seq = self.change_seq
+        for pk, price, stock, seq in rows:
+            entries[pk] = PriceEntry(price, stock)
+            if seq is not None:
+                change_seq = max(change_seq, seq)
+        for pk, seq in deleted:
+            entries.pop(pk, None)
+            change_seq = max(change_seq, seq)
+        self.entries = entries
+        self.change_seq = change_seq
+
+
+price_table = PriceTable()
+
+
+def quote(items):
+    """
+    Price a cart as checkout would, without writing anything.
+
+    Args:
+        items (list): Dicts with ``product`` (id) and ``quantity`` keys.
+            Repeated products are merged into a single line.
+
+    Returns:
+        Quote: The lines and the order totals, delivery included.
+
+    Raises:
+        ValidationError: A product doesn't exist or has fewer units in
+            stock than the cart asks for.
+    """
+    bag = {}
+    for item in items:
+        bag[item['product']] = bag.get(item['product'], 0) + item['quantity']
+
+    entries = price_table.current()
+    missing = sorted(pk for pk in bag if pk not in entries)
+    if missing:
+        raise ValidationError(
+            {'items': [f'Product {pk} does not exist.' for pk in missing]}
+            )
+    # The same check as reserve_stock()
+    short = sorted(
+        pk for pk, quantity in bag.items()
+        if entries[pk].stock is not None and entries[pk].stock < quantity
+    )
+    if short:
+        raise ValidationError(
+            {'items': [f'Product {pk} is out of stock.' for pk in short]}
+            )
+
+    lines = [
+        QuoteLine(pk, quantity, entries[pk].price, entries[pk].price * quantity)
+        for pk, quantity in bag.items()
+    ]
+    # The same arithmetic as Order.set_totals()
+    order_total = sum(
+        (line.line_total for line in lines), Decimal(0)
+    ).quantize(Decimal('0.01'))
+    delivery_cost = Order.calculate_delivery(order_total)
+    return Quote(lines, order_total, delivery_cost, order_total + delivery_cost)
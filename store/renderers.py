@@ -0,0 +1,46 @@
+"""
+JSON rendering for high-volume catalog responses.
+"""
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed.
+
+    With DRF's default compact, unicode, strict settings orjson produces
+    the same bytes as the stdlib encoder for the strings, integers,
+    booleans, lists and dicts serializers return, so it is a drop-in for
+    views whose data holds no floats. Anything else, such as indented
+    output for the browsable API or a value orjson rejects, goes through
+    JSONRenderer unchanged.
+    """
+    OPTIONS = (
+        orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if orjson else 0
+    )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None
+            or self.ensure_ascii or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=self.OPTIONS
+                )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Match JSONRenderer, which escapes these for JavaScript
+        return ret.replace(
+            '\u2028'.encode(), b'\\u2028'
+            ).replace('\u2029'.encode(), b'\\u2029')
@@ -0,0 +1,310 @@
+"""
+Incrementally maintained sales rollups.
+
+Every order contributes one row's worth of counts and sums to DailySales
+and one per product to DailyProductSales, keyed on its order date and
+status. Placing an order adds its contribution, a status change moves it
+to the new status and deleting the order takes it away, each with one
+upsert per table inside the order's own transaction, so reports read a
+few small rows whatever the size of the order history. Lines added,
+edited or deleted after checkout apply their difference the same way
+(change_line()), so the rollups always hold what each order's current
+lines and totals contribute, which is what a status change or deletion
+takes back out.
+
+Queryset update()s of lines or totals bypass all of this; rebuild()
+recomputes any date range from the orders themselves.
+"""
+from collections import defaultdict
+from decimal import Decimal
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import DailyProductSales, DailySales, Order, OrderItem
+
+DAY_FIELDS = ('orders', 'units', 'order_total', 'delivery_cost', 'total_price')
+PRODUCT_FIELDS = ('orders', 'units', 'revenue')
+
+
+def _upsert_increments(model, key_fields, sum_fields, rows):
+    """
+    Add ``rows`` ({key tuple: value tuple}) onto the matching rollup rows,
+    creating missing ones.
+
+    PostgreSQL and SQLite do it in one INSERT ... ON CONFLICT statement.
+    Keys are written in sorted order, so concurrent orders touching the
+    same rows lock them in the same order.
+    """
+    if not rows:
+        return
+    rows = sorted(rows.items())
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        for key, values in rows:
+            lookup = dict(zip(key_fields, key))
+            increments = dict(zip(sum_fields, values))
+            if not model.objects.filter(**lookup).update(**{
+                field: F(field) + value for field, value in increments.items()
+            }):
+                model.objects.create(**lookup, **increments)
+        return
+
+    table = connection.ops.quote_name(model._meta.db_table)
+    key_columns = [model._meta.get_field(name).column for name in key_fields]
+    columns = [
+        connection.ops.quote_name(column)
+        for column in key_columns + list(sum_fields)
+    ]
+    placeholders = '(%s)' % ', '.join(['%s'] * len(columns))
+    updates = ', '.join(
+        f'{column} = {table}.{column} + excluded.{column}'
+        for column in columns[len(key_fields):]
+    )
+    conflict = ', '.join(columns[:len(key_fields)])
+    sql = (
+        f"INSERT INTO {table} ({', '.join(columns)}) "
+        f"VALUES {', '.join([placeholders] * len(rows))} "
+        f"ON CONFLICT ({conflict}) DO UPDATE SET {updates}"
+    )
+    params = [value for key, values in rows for value in (*key, *values)]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def _apply(order, status, lines, sign):
+    """
+    Add (``sign`` 1) or remove (-1) an order's contribution under
+    ``status``.
+
+    Args:
+        order (Order): The order, with its totals loaded.
+        status (str): The status bucket to change.
+        lines (list): (product id, quantity, item total) tuples.
+        sign (int): 1 or -1.
+    """
+    date = timezone.localdate(order.date)
+    products = defaultdict(lambda: [0, Decimal(0)])
+    for product_id, quantity, item_total in lines:
+        products[product_id][0] += quantity
+        products[product_id][1] += item_total
+    _upsert_increments(
+        DailyProductSales, ('date', 'product', 'status'), PRODUCT_FIELDS,
+        {
+            (date, product_id, status): (sign, sign * units, sign * revenue)
+            for product_id, (units, revenue) in products.items()
+        },
+    )
+    _upsert_increments(
+        DailySales, ('date', 'status'), DAY_FIELDS,
+        {(date, status): (
+            sign,
+            sign * sum(units for units, _ in products.values()),
+            sign * order.order_total,
+            sign * order.delivery_cost,
+            sign * order.total_price,
+        )},
+    )
+
+
+def _lines(order):
+    return list(order.items.values_list('product_id', 'quantity', 'item_total'))
+
+
+def record_order(order, lines):
+    """
+    Add a newly placed order. ``lines`` are its OrderItems, so checkout
+    doesn't read them back.
+    """
+    _apply(
+        order, order.status,
+        [(line.product_id, line.quantity, line.item_total) for line in lines],
+        1,
+    )
+
+
+def change_line(order, old, new, deleted_product=None):
+    """
+    Apply one line edit made after checkout.
+
+    Args:
+        order (Order): The order, with its totals after the edit loaded.
+        old (tuple): The line's (product id, quantity, item total) before
+            the edit, or None for a new line.
+        new (tuple): The same after the edit, or None for a removed line.
+        deleted_product (int): A product being deleted, whose own rollup
+            rows go with it and so are left alone.
+    """
+    date = timezone.localdate(order.date)
+    products = defaultdict(lambda: [0, 0, Decimal(0)])
+    units = 0
+    revenue = Decimal(0)
+    for line, sign in ((old, -1), (new, 1)):
+        if line is None:
+            continue
+        product_id, quantity, item_total = line
+        products[product_id][0] += sign
+        products[product_id][1] += sign * quantity
+        products[product_id][2] += sign * item_total
+        units += sign * quantity
+        revenue += sign * item_total
+    _upsert_increments(
+        DailyProductSales, ('date', 'product', 'status'), PRODUCT_FIELDS,
+        {
+            (date, product_id, order.status): tuple(values)
+            for product_id, values in products.items()
+            if any(values) and product_id != deleted_product
+        },
+    )
+    # Delivery isn't linear in the total, so take the difference between
+    # the charge on the old and the new total
+    order_total = Decimal(order.order_total)
+    delivery_before = Order.calculate_delivery(order_total - revenue)
+    _upsert_increments(
+        DailySales, ('date', 'status'), DAY_FIELDS,
+        {(date, order.status): (
+            0,
+            units,
+            revenue,
+            order.delivery_cost - delivery_before,
+            order.total_price - (order_total - revenue + delivery_before),
+        )},
+    )
+
+
+def move_order(order, old_status):
+    """
+    Move an order's contribution from ``old_status`` to its current one.
+    """
+    lines = _lines(order)
+    _apply(order, old_status, lines, -1)
+    _apply(order, order.status, lines, 1)
+
+
+def remove_order(order):
+    """
+    Take a deleted order's contribution away. Called before its lines go.
+    """
+    _apply(order, order.status, _lines(order), -1)
+
+
+def rebuild(date_from=None, date_to=None):
+    """
+    Recompute the rollups for a date range (inclusive; open-ended when a
+    bound is None) from the orders, in one transaction.
+
+    The old rows are deleted before the orders are read, so a checkout
+    that upserts a deleted row holds the deletion back until it commits
+    and is then counted by the recompute.
+
+    Returns:
+        tuple: The number of day rows and product rows written.
+    """
+    orders = Order.objects.annotate(day=TruncDate('date'))
+    items = OrderItem.objects.annotate(day=TruncDate('order__date'))
+    rollups = [DailySales.objects.all(), DailyProductSales.objects.all()]
+    if date_from:
+        orders, items = orders.filter(day__gte=date_from), items.filter(day__gte=date_from)
+        rollups = [rows.filter(date__gte=date_from) for rows in rollups]
+    if date_to:
+        orders, items = orders.filter(day__lte=date_to), items.filter(day__lte=date_to)
+        rollups = [rows.filter(date__lte=date_to) for rows in rollups]
+
+    with transaction.atomic():
+        for rows in rollups:
+            rows.delete()
+
+        days = {
+            (row['day'], row['status']): row for row in orders
+            .values('day', 'status')
+            .annotate(
+                orders=Count('id'),
+                order_total=Sum('order_total'),
+                delivery_cost=Sum('delivery_cost'),
+                total_price=Sum('total_price'),
+            )
+        }
+        # Product rows are written as they stream in, so memory stays
+        # flat however many orders the range holds
+        product_rows = []
+        product_count = 0
+        units = defaultdict(int)
+        for row in items.values('day', 'product_id', 'order__status').annotate(
+            orders=Count('order_id', distinct=True),
+            units=Sum('quantity'),
+            revenue=Sum('item_total'),
+        ).iterator():
+            units[(row['day'], row['order__status'])] += row['units']
+            product_count += 1
+            product_rows.append(DailyProductSales(
+                date=row['day'],
+                product_id=row['product_id'],
+                status=row['order__status'],
+                orders=row['orders'],
+                units=row['units'],
+                revenue=row['revenue'],
+            ))
+            if len(product_rows) == 1000:
+                DailyProductSales.objects.bulk_create(product_rows)
+                product_rows = []
+        DailyProductSales.objects.bulk_create(product_rows)
+        DailySales.objects.bulk_create([
+            DailySales(
+                date=day,
+                status=status,
+                orders=row['orders'],
+                units=units[(day, status)],
+                order_total=row['order_total'] or 0,
+                delivery_cost=row['delivery_cost'] or 0,
+                total_price=row['total_price'] or 0,
+            )
+            for (day, status), row in days.items()
+        ], batch_size=1000)
+    return len(days), product_count
+
+
+def _filter_rollups(rows, filters):
+    if filters.get('date_from'):
+        rows = rows.filter(date__gte=filters['date_from'])
+    if filters.get('date_to'):
+        rows = rows.filter(date__lte=filters['date_to'])
+    if filters.get('status'):
+        rows = rows.filter(status=filters['status'])
+    return rows
+
+
+def daily_sales(filters):
+    """
+    Per-day totals from DailySales, oldest first, summed over statuses
+    unless ``filters`` picks one.
+    """
+    return list(
+        _filter_rollups(DailySales.objects.all(), filters)
+        .values('date')
+        .annotate(
+            order_count=Sum('orders'),
+            units_sold=Sum('units'),
+            items_total=Sum('order_total'),
+            delivery_total=Sum('delivery_cost'),
+            revenue=Sum('total_price'),
+        )
+        .filter(order_count__gt=0)
+        .order_by('date')
+    )
+
+
+def product_sales(filters, limit):
+    """
+    Per-product totals from DailyProductSales, best selling by revenue
+    first.
+    """
+    return list(
+        _filter_rollups(DailyProductSales.objects.all(), filters)
+        .values('product_id', 'product__name')
+        .annotate(
+            order_count=Sum('orders'),
+            units_sold=Sum('units'),
+            revenue=Sum('revenue'),
+        )
+        .filter(units_sold__gt=0)
+        .order_by('-revenue', 'product_id')[:limit]
+    )
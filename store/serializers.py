@@ -1,7 +1,233 @@
+import decimal
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.functional import cached_property
 from rest_framework import serializers
-from .models import Product
+from rest_framework.settings import api_settings
+from .models import Order, OrderItem, Product
+from .services import place_order
 
 class ProductSerializer(serializers.ModelSerializer):
+    in_stock = serializers.BooleanField(read_only=True)
+
     class Meta:
         model = Product
         fields = '__all__'
+
+
+def _fast_converter(field):
+    """
+    Return a cheaper equivalent of ``field.to_representation`` for the
+    common field types, or the bound method itself.
+    """
+    if type(field) is serializers.IntegerField:
+        return int
+    if type(field) is serializers.CharField:
+        return str
+    if type(field) is serializers.DecimalField and field.decimal_places is not None:
+        coerce_to_string = getattr(
+            field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING
+            )
+        if coerce_to_string and not field.localize and not field.normalize_output:
+            context = decimal.getcontext().copy()
+            if field.max_digits is not None:
+                context.prec = field.max_digits
+            quantum = decimal.Decimal('.1') ** field.decimal_places
+            rounding = field.rounding
+
+            def convert(value):
+                if not isinstance(value, decimal.Decimal):
+                    value = decimal.Decimal(str(value).strip())
+                return '{:f}'.format(
+                    value.quantize(quantum, rounding=rounding, context=context)
+                    )
+            return convert
+    return field.to_representation
+
+
+class ValuesSerializer:
+    """
+    Read-only fast path rendering ``.values()`` rows exactly as
+    ``serializer_class`` renders model instances.
+
+    The serializer's readable fields are inspected once and turned into a
+    list of (name, column, compute, convert) steps, so serializing a row
+    is a dict lookup and a plain function call per field, with no model
+    instance or field dispatch in between. Fields whose source is not a
+    column, such as model properties, are listed in ``computed`` as
+    ``name: (column, function)``; the function receives the column value.
+
+    Attributes:
+        serializer_class (type): The ModelSerializer being mirrored.
+        computed (dict): Non-column fields and how to derive them.
+    """
+
+    def __init__(self, serializer_class, computed=None):
+        self.serializer_class = serializer_class
+        self.computed = computed or {}
+
+    @cached_property
+    def steps(self):
+        steps = []
+        for field in self.serializer_class().fields.values():
+            if field.write_only:
+                continue
+            column, compute = field.source, None
+            if field.field_name in self.computed:
+                column, compute = self.computed[field.field_name]
+            elif '.' in column or column == '*':
+                raise ImproperlyConfigured(
+                    f'{self.serializer_class.__name__}.{field.field_name} '
+                    f'is not a column; list it in computed.'
+                    )
+            steps.append((field.field_name, column, compute, _fast_converter(field)))
+        return steps
+
+    @cached_property
+    def columns(self):
+        """
+        The columns to pass to ``.values()``.
+        """
+        return tuple(dict.fromkeys(column for _, column, _, _ in self.steps))
+
+    def to_representation(self, row):
+        data = {}
+        for name, column, compute, convert in self.steps:
+            value = row[column]
+            if compute is not None:
+                value = compute(value)
+            data[name] = None if value is None else convert(value)
+        return data
+
+    def many(self, rows):
+        to_representation = self.to_representation
+        return [to_representation(row) for row in rows]
+
+
+product_values_serializer = ValuesSerializer(
+    ProductSerializer,
+    computed={'in_stock': ('stock', Product.is_in_stock)}
+    )
+
+
+class CheckoutItemSerializer(serializers.Serializer):
+    product = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1)
+
+
+class CheckoutSerializer(serializers.ModelSerializer):
+    items = CheckoutItemSerializer(many=True, write_only=True, allow_empty=False)
+
+    class Meta:
+        model = Order
+        fields = (
+            'order_number', 'first_name', 'last_name', 'email',
+            'phone_number', 'street_address1', 'street_address2',
+            'country', 'town', 'county', 'postcode', 'item_count',
+            'line_summary', 'items', 'order_total', 'delivery_cost',
+            'total_price', 'status',
+        )
+        read_only_fields = (
+            'order_number', 'order_total', 'delivery_cost',
+            'total_price', 'status',
+        )
+
+    def create(self, validated_data):
+        items = validated_data.pop('items')
+        customer = validated_data.pop('customer', None)
+        return place_order(validated_data, items, customer=customer)
+
+
+class QuoteRequestSerializer(serializers.Serializer):
+    items = CheckoutItemSerializer(many=True, allow_empty=False)
+
+
+class OrderItemSerializer(serializers.ModelSerializer):
+    product_name = serializers.CharField(source='product.name', read_only=True)
+
+    class Meta:
+        model = OrderItem
+        fields = ('product', 'product_name', 'quantity', 'item_total')
+
+
+class OrderListSerializer(serializers.ModelSerializer):
+    """
+    Compact order for history lists, built from the order row alone.
+    """
+
+    class Meta:
+        model = Order
+        fields = (
+            'order_number', 'date', 'status', 'item_count', 'line_summary',
+            'total_price',
+        )
+        read_only_fields = fields
+
+
+order_list_values_serializer = ValuesSerializer(OrderListSerializer)
+
+
+class OrderDetailSerializer(serializers.ModelSerializer):
+    items = OrderItemSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Order
+        fields = (
+            'order_number', 'date', 'status', 'first_name', 'last_name',
+            'email', 'phone_number', 'street_address1', 'street_address2',
+            'country', 'town', 'county', 'postcode', 'item_count',
+            'line_summary', 'items', 'order_total', 'delivery_cost',
+            'total_price',
+        )
+        read_only_fields = fields
+
+
+class CatalogSyncSerializer(serializers.Serializer):
+    since = serializers.IntegerField(min_value=0, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=500)
+
+
+class OrderExportFilterSerializer(serializers.Serializer):
+    output = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES, required=False)
+    after_id = serializers.IntegerField(min_value=0, required=False)
+
+
+class SalesReportFilterSerializer(serializers.Serializer):
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES, required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=50)
+
+
+class DailySalesSerializer(serializers.Serializer):
+    date = serializers.DateField()
+    orders = serializers.IntegerField(source='order_count')
+    units = serializers.IntegerField(source='units_sold')
+    order_total = serializers.DecimalField(
+        source='items_total', max_digits=None, decimal_places=2
+        )
+    delivery_cost = serializers.DecimalField(
+        source='delivery_total', max_digits=None, decimal_places=2
+        )
+    total_price = serializers.DecimalField(
+        source='revenue', max_digits=None, decimal_places=2
+        )
+    delivery_share = serializers.SerializerMethodField()
+
+    def get_delivery_share(self, row):
+        """
+        Delivery's share of what customers paid, to four places.
+        """
+        if not row['revenue']:
+            return None
+        return f"{row['delivery_total'] / row['revenue']:.4f}"
+
+
+class ProductSalesSerializer(serializers.Serializer):
+    product = serializers.IntegerField(source='product_id')
+    name = serializers.CharField(source='product__name')
+    orders = serializers.IntegerField(source='order_count')
+    units = serializers.IntegerField(source='units_sold')
+    revenue = serializers.DecimalField(max_digits=None, decimal_places=2)
@@ -0,0 +1,221 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from . import rollups
+from .cache import bump_catalog_version, guest_orders_key
+from .models import (
+    CatalogSequence,
+    Customer,
+    Order,
+    OrderItem,
+    Product,
+    ProductTombstone,
+)
+
+
+def reserve_stock(quantities):
+    """
+    Take ``quantities`` ({product id: units}) out of stock, all or nothing.
+
+    Must run inside a transaction. The products are locked with one
+    SELECT ... FOR UPDATE in primary key order, so concurrent checkouts
+    that share products always lock them in the same order and can't
+    deadlock. The decrement is a single conditional UPDATE that only
+    matches rows still holding enough stock, as a guard on databases
+    without row locks. The products move up the catalog change feed after
+    the checkout commits, so concurrent checkouts don't queue on the
+    sequence row, and the catalog version is bumped so cached listings
+    and their ETags pick up the new stock.
+
+    Returns:
+        dict: The locked products keyed by id, with name, price and stock
+        loaded.
+    """
+    products = {
+        product.pk: product for product in Product.objects
+        .select_for_update()
+        .only('id', 'name', 'price', 'stock')
+        .filter(pk__in=list(quantities))
+        .order_by('pk')
+    }
+    missing = sorted(set(quantities) - set(products))
+    if missing:
+        raise ValidationError(
+            {'items': [f'Product {pk} does not exist.' for pk in missing]}
+            )
+    short = sorted(
+        pk for pk, quantity in quantities.items()
+        if products[pk].stock is not None and products[pk].stock < quantity
+    )
+    if short:
+        raise ValidationError(
+            {'items': [f'Product {pk} is out of stock.' for pk in short]}
+            )
+
+    tracked = {
+        pk: quantity for pk, quantity in quantities.items()
+        if products[pk].stock is not None
+    }
+    if not tracked:
+        return products
+    amount = Case(
+        *[When(pk=pk, then=Value(quantity)) for pk, quantity in tracked.items()],
+        output_field=models.IntegerField(),
+    )
+    updated = Product.objects.filter(
+        pk__in=list(tracked),
+        stock__gte=amount,
+    ).update(
+        stock=F('stock') - amount,
+        modified_at=timezone.now(),
+        )
+    if updated != len(tracked):
+        raise ValidationError({'items': ['Some products are out of stock.']})
+
+    for pk, quantity in tracked.items():
+        products[pk].stock -= quantity
+    # Cached catalog responses, and the ETags clients revalidate with,
+    # show the stock, so any change to it needs a new catalog version.
+    transaction.on_commit(bump_catalog_version)
+    return products
+
+
+@transaction.atomic
+def place_order(order_data, items, customer=None):
+    """
+    Create an order and all of its lines in a single transaction.
+
+    Prices come from the same batched fetch that reserves the stock, the
+    lines are inserted with a single bulk_create and the order totals are
+    computed once in memory, so checkout runs a constant number of
+    queries regardless of how many lines the cart holds.
+
+    Args:
+        order_data (dict): Order contact and address fields.
+        items (list): Dicts with ``product`` (id) and ``quantity`` keys.
+            Repeated products are merged into a single line.
+        customer (Customer): Optional profile to attach the order to.
+
+    Returns:
+        Order: The saved order with its totals set.
+    """
+    bag = {}
+    for item in items:
+        bag[item['product']] = bag.get(item['product'], 0) + item['quantity']
+
+    products = reserve_stock(bag)
+
+    lines = [
+        OrderItem(
+            product=products[pk],
+            quantity=quantity,
+            item_total=products[pk].price * quantity,
+        )
+        for pk, quantity in bag.items()
+    ]
+
+    order = Order(
+        customer=customer,
+        bag={str(pk): quantity for pk, quantity in bag.items()},
+        **order_data
+        )
+    order.set_totals(sum(line.item_total for line in lines))
+    order.set_summary([(line.product.name, line.quantity) for line in lines])
+    order.save()
+
+    for line in lines:
+        line.order = order
+    OrderItem.objects.bulk_create(lines)
+    # Last, so the rollup rows every checkout shares are locked briefly
+    rollups.record_order(order, lines)
+    return order
+
+
+def claim_guest_orders(user, customer=None):
+    """
+    Attach every unclaimed guest order placed with the user's email to
+    their customer profile in one set-based UPDATE.
+
+    The lookup is served by the partial index on unclaimed order emails.
+    Once an address has been cleared it is flagged in the cache, and the
+    flag is dropped when a new guest order placed with it commits, so
+    repeat logins skip the work entirely. The flag also expires after
+    GUEST_ORDERS_FLAG_TIMEOUT, so a worker whose cache missed the drop
+    (a per-process cache) claims again soon after.
+
+    Args:
+        user (User): The user whose email the orders were placed with.
+        customer (Customer): The user's profile, if the caller already
+            has it; otherwise it is fetched or created when needed.
+
+    Returns:
+        int: The number of orders claimed.
+    """
+    if not user.email:
+        return 0
+    key = guest_orders_key(user.email)
+    if cache.get(key) is False:
+        return 0
+    # Flag first: a guest order placed while the UPDATE runs clears it again
+    cache.set(key, False, timeout=settings.GUEST_ORDERS_FLAG_TIMEOUT)
+    try:
+        if customer is None:
+            customer, _ = Customer.objects.get_or_create(user=user)
+        return Order.objects.filter(
+            customer__isnull=True,
+            email=user.email
+        ).update(customer=customer)
+    except Exception:
+        cache.delete(key)
+        raise
+
+
+def catalog_changes(since, limit, columns):
+    """
+    The catalog changes after sequence number ``since``, oldest first.
+
+    Pending products are numbered first. Live products and tombstones are
+    then each read with one indexed range scan on ``change_seq`` and
+    merged, so the cost follows the number of changes rather than the
+    size of the catalog.
+
+    Args:
+        since (int): The client's last token; 0 for everything.
+        limit (int): The most changes to return.
+        columns (tuple): Product columns to fetch for changed rows.
+
+    Returns:
+        dict: ``changed`` product rows, ``deleted`` product ids, the
+        ``token`` to send next time and whether ``more`` changes follow.
+    """
+    # Number anything still pending, such as writes whose own renumber
+    # failed, so they reach the feed
+    CatalogSequence.renumber()
+    rows = list(
+        Product.objects
+        .filter(change_seq__gt=since)
+        .order_by('change_seq')
+        .values('change_seq', *columns)[:limit + 1]
+    )
+    tombstones = list(
+        ProductTombstone.objects
+        .filter(change_seq__gt=since)
+        .order_by('change_seq')
+        .values_list('change_seq', 'product_id')[:limit + 1]
+    )
+    changes = sorted(
+        [(row['change_seq'], row, None) for row in rows]
+        + [(seq, None, product_id) for seq, product_id in tombstones],
+        key=lambda change: change[0],
+    )
+    more = len(changes) > limit
+    changes = changes[:limit]
+    return {
+        'changed': [row for _, row, _ in changes if row is not None],
+        'deleted': [pk for _, row, pk in changes if row is None],
+        'token': changes[-1][0] if changes else since,
+        'more': more,
+    }
@@ -0,0 +1,108 @@
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import rollups
+from .cache import bump_catalog_version
+from .models import (
+    CatalogSequence,
+    Order,
+    OrderItem,
+    Product,
+    ProductTombstone,
+    order_line_changed,
+)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_catalog_cache(sender, **kwargs):
+    """
+    Bump the catalog version whenever a product is written or removed.
+
+    The bump waits for the commit, so nothing that sees the new version
+    can reload the catalog before the write is visible. Queryset.update()
+    and bulk_create() do not send these signals, so code that uses them
+    must call bump_catalog_version() itself.
+    """
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_delete, sender=Product)
+def record_product_tombstone(sender, instance, **kwargs):
+    """
+    Tell sync clients the product is gone. Runs inside the deletion's
+    transaction, after the product row is locked.
+    """
+    ProductTombstone.objects.create(
+        product_id=instance.pk,
+        change_seq=CatalogSequence.allocate()[0],
+        )
+
+
+@receiver(post_save, sender=Order)
+def move_order_in_rollups(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Move an order between status buckets in the sales rollups when its
+    status is saved with a new value. New orders are added by
+    place_order(), which already has their lines.
+    """
+    old_status = getattr(instance, '_saved_status', None)
+    if created or old_status is None or old_status == instance.status:
+        return
+    if update_fields is not None and 'status' not in update_fields:
+        return
+    rollups.move_order(instance, old_status)
+
+
+@receiver(pre_delete, sender=Order)
+def remove_order_from_rollups(sender, instance, **kwargs):
+    """
+    Take a deleted order out of the sales rollups while its lines still
+    exist.
+    """
+    rollups.remove_order(instance)
+
+
+@receiver(order_line_changed)
+def apply_line_change_to_rollups(
+        sender, order, old, new, deleted_product=None, **kwargs):
+    """
+    Keep the sales rollups in step with line edits made after checkout,
+    so they always hold what the order's current lines contribute.
+    """
+    rollups.change_line(order, old, new, deleted_product=deleted_product)
+
+
+@receiver(order_line_changed)
+def update_line_summary(sender, order, old, new, **kwargs):
+    """
+    Keep the order's item count and line summary in step with line edits.
+    """
+    order.update_summary(old, new)
+
+
+@receiver(post_delete, sender=OrderItem)
+def subtract_deleted_item(sender, instance, origin=None, **kwargs):
+    """
+    Take a deleted line off its order's totals and summary, unless the
+    line is going because its whole order is being deleted.
+    """
+    if isinstance(origin, Order) or (
+        isinstance(origin, QuerySet) and origin.model is Order
+    ):
+        return
+    deleted_product = None
+    if isinstance(origin, Product) or (
+        isinstance(origin, QuerySet) and origin.model is Product
+    ):
+        # The product's rollup rows are being deleted with it
+        deleted_product = instance.product_id
+    old = instance.saved_line()
+    order = Order.objects.get(pk=instance.order_id)
+    order.adjust_totals(-old[2])
+    order_line_changed.send(
+        sender=OrderItem, order=order, old=old, new=None,
+        deleted_product=deleted_product,
+        )
@@ -1,3 +1,1217 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock
+from asgiref.sync import async_to_sync
+from datetime import datetime, timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import DatabaseError, connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+    skipUnlessDBFeature,
+)
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+from config.metrics import registry
+from config.db_routers import (
+    PIN_COOKIE,
+    REPLICA_DB_ALIAS,
+    PrimaryReplicaRouter,
+    ReplicaPinMiddleware,
+    primary_reads,
+    replica_reads,
+    wants_replica,
+)
+
+from store.cache import get_catalog_version
+from store.exports import ITEM_FIELDS, ORDER_FIELDS
+from store.models import (
+    CatalogSequence,
+    DailyProductSales,
+    DailySales,
+    Order,
+    OrderItem,
+    Product,
+)
+from store.pricing import quote
+from store.rollups import rebuild
+from store.services import place_order
+from store.ulid import new_ulid
+from store.views import ProductViewSet
+from tests.benchmarks import (
+    SCENARIOS,
+    benchmark_environment,
+    check_response,
+    place_orders,
+    render_page_with_serializer,
+    render_page_with_values,
+    reset_caches,
+    seed,
+)
+from users.throttling import UserRateThrottle
+
+User = get_user_model()
+
+
+class ReplicaRoutingTests(SimpleTestCase):
+    """
+    Reads go to the replica only inside replica_reads(), outside
+    transactions, and not while the user is pinned after a write.
+    """
+
+    def setUp(self):
+        # Routing only checks that the alias is configured; nothing here
+        # connects to it
+        replica = mock.patch.dict(settings.DATABASES, {REPLICA_DB_ALIAS: {}})
+        replica.start()
+        self.addCleanup(replica.stop)
+        self.router = PrimaryReplicaRouter()
+        self.user = SimpleNamespace(pk=7, is_authenticated=True)
+
+    def read_alias(self, request=None):
+        with replica_reads(request):
+            return self.router.db_for_read(Product)
+
+    def write(self, method='POST', asynchronous=False):
+        request = RequestFactory().generic(method, '/api/checkout/')
+        request.user = self.user
+        if asynchronous:
+            async def get_response(request):
+                return HttpResponse()
+            return async_to_sync(ReplicaPinMiddleware(get_response))(request)
+        return ReplicaPinMiddleware(lambda request: HttpResponse())(request)
+
+    def request_after(self, response):
+        request = RequestFactory().get('/api/products/')
+        request.COOKIES[PIN_COOKIE] = response.cookies[PIN_COOKIE].value
+        request.user = self.user
+        return request
+
+    def test_routing_decisions(self):
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+        self.assertEqual(self.read_alias(), REPLICA_DB_ALIAS)
+        self.assertEqual(self.router.db_for_write(Product), 'default')
+        with replica_reads(), primary_reads():
+            self.assertEqual(self.router.db_for_read(Product), 'default')
+            # A view opting in again inside primary_reads() stays put
+            self.assertEqual(self.read_alias(), 'default')
+        with mock.patch.object(connections['default'], 'in_atomic_block', True):
+            self.assertEqual(self.read_alias(), 'default')
+        self.assertTrue(self.router.allow_migrate('default', 'store'))
+        self.assertFalse(self.router.allow_migrate(REPLICA_DB_ALIAS, 'store'))
+
+    def test_write_pins_reads_until_the_pin_expires(self):
+        self.assertNotIn(PIN_COOKIE, self.write('GET').cookies)
+        for asynchronous in (False, True):
+            with self.subTest(asynchronous=asynchronous):
+                request = self.request_after(self.write(asynchronous=asynchronous))
+                self.assertEqual(self.read_alias(request), 'default')
+
+                later = time.time() + settings.REPLICA_PIN_SECONDS + 1
+                with mock.patch('django.core.signing.time.time', return_value=later):
+                    self.assertEqual(self.read_alias(request), REPLICA_DB_ALIAS)
+
+        # The pin only holds for the user it was set for
+        request = self.request_after(self.write())
+        request.user = SimpleNamespace(pk=8, is_authenticated=True)
+        self.assertEqual(self.read_alias(request), REPLICA_DB_ALIAS)
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']
+)
+class QueryBudgetTests(TestCase):
+    """
+    Each benchmark scenario must run in exactly its query budget on a
+    cold cache. Update the budget deliberately when a change needs to.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed(products=60)
+
+    def test_endpoints_stay_within_query_budget(self):
+        with benchmark_environment():
+            for scenario_class in SCENARIOS:
+                with self.subTest(scenario_class.name):
+                    scenario = scenario_class(self.user)
+                    scenario.prepare(0)
+                    reset_caches()
+                    with self.assertNumQueries(scenario.budget):
+                        response = scenario.run(0)
+                    check_response(scenario, response)
+
+
+class MetricsTests(TestCase):
+    """
+    Every request is timed and its queries counted under its route, in
+    sync and async chains, and the totals are served to Prometheus and
+    staff.
+    """
+
+    def setUp(self):
+        self.user = seed(products=3)
+        self.user.is_staff = True
+        self.user.save()
+        self.headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'
+        }
+        reset_caches()
+
+    def test_requests_are_timed_and_counted(self):
+        for path, route, get in (
+            ('/api/products/', 'product-list', self.client.get),
+            # Through the async middleware chain
+            ('/api/async/products/', 'async-product-list',
+             async_to_sync(self.async_client.get)),
+        ):
+            with self.subTest(route):
+                before = registry.get(route).as_dict()
+                with benchmark_environment(), \
+                        CaptureQueriesContext(connection) as queries:
+                    response = get(path, headers={
+                        'Authorization': self.headers['HTTP_AUTHORIZATION']
+                    })
+                self.assertEqual(response.status_code, 200)
+                after = registry.get(route).as_dict()
+                self.assertEqual(after['requests'], before['requests'] + 1)
+                self.assertEqual(
+                    after['queries'] - before['queries'], len(queries)
+                    )
+                self.assertGreater(after['seconds'], before['seconds'])
+                self.assertEqual(
+                    sum(after['buckets'].values()), after['requests']
+                    )
+
+    def test_metrics_endpoints_render(self):
+        with benchmark_environment():
+            self.client.get('/api/products/', **self.headers)
+            with override_settings(METRICS_TOKEN='scrape'):
+                self.assertEqual(self.client.get('/metrics').status_code, 403)
+                scrape = self.client.get(
+                    '/metrics', HTTP_AUTHORIZATION='Bearer scrape'
+                    )
+            staff = self.client.get('/api/metrics/', **self.headers)
+        count = registry.get('product-list').count
+        self.assertEqual(scrape.status_code, 200)
+        self.assertIn(
+            f'http_request_duration_seconds_count{{route="product-list"}} {count}\n',
+            scrape.content.decode(),
+            )
+        self.assertEqual(staff.json()['routes']['product-list']['requests'], count)
+
+
+class ValuesSerializerTests(TestCase):
+    """
+    The product list fast path must render the same bytes as
+    ProductSerializer and JSONRenderer.
+    """
+
+    def test_fast_path_output_is_byte_identical(self):
+        Product.objects.bulk_create([
+            Product(name='Plain', price=Decimal('1.50'), stock=3),
+            Product(name='Sold out', price=Decimal('0'), stock=0),
+            Product(name='Untracked', price=Decimal('99999999.99')),
+            Product(
+                name='Caf\u00e9 \u2603 "quoted" \\ back\tslash',
+                description='Line\nbreak \u2028 separator \u2029 \x01 \U0001f600',
+                price=Decimal('12.30'),
+                stock=7,
+            ),
+        ])
+        queryset = Product.objects.order_by('id')
+        self.assertEqual(
+            render_page_with_values(queryset),
+            render_page_with_serializer(queryset)
+            )
+
+
+class ProductPaginationTests(TestCase):
+    """
+    The catalog pages through a keyset cursor in id order, with page
+    sizes capped.
+    """
+
+    def setUp(self):
+        self.user = seed(products=250)
+        self.headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'
+        }
+
+    def get(self, url):
+        # Each page straight from the database, not the response cache
+        reset_caches()
+        with benchmark_environment():
+            return self.client.get(url, **self.headers).json()
+
+    def test_page_sizes_are_capped(self):
+        for query, size in (
+            ('', 50), ('?page_size=10', 10), ('?page_size=500', 200),
+            ('?page_size=0', 50), ('?page_size=many', 50),
+        ):
+            with self.subTest(query):
+                self.assertEqual(
+                    len(self.get(f'/api/products/{query}')['results']), size
+                    )
+
+    def test_walk_is_stable_while_the_catalog_changes(self):
+        ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+        seen = []
+        url = '/api/products/?page_size=40'
+        while url:
+            page = self.get(url)
+            seen += [row['id'] for row in page['results']]
+            url = page['next']
+            if len(seen) == 80:
+                # Rows inserted or deleted behind or ahead of the cursor
+                # don't shift the pages still to come
+                Product.objects.filter(pk__in=[ids[0], ids[200]]).delete()
+                added = Product.objects.create(name='Late', price=Decimal('1.00'))
+        expected = [pk for pk in ids if pk not in (ids[0], ids[200])] + [added.pk]
+        self.assertEqual(seen, ids[:80] + expected[79:])
+        self.assertEqual(len(seen), len(set(seen)))
+
+
+class CatalogCacheTests(TestCase):
+    """
+    Catalog responses are cached under the catalog version, with strong
+    ETags that conditional GETs can revalidate against.
+    """
+
+    def setUp(self):
+        self.user = seed(products=3)
+        self.headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'
+        }
+        reset_caches()
+
+    def get(self, path, **headers):
+        with benchmark_environment():
+            return self.client.get(path, **self.headers, **headers)
+
+    def test_hits_and_conditional_gets_skip_the_database(self):
+        first = self.get('/api/products/')
+        self.assertEqual(first.status_code, 200)
+        etag = first['ETag']
+        with self.assertNumQueries(0):
+            hit = self.get('/api/products/')
+        self.assertEqual(hit.content, first.content)
+        self.assertEqual(hit['ETag'], etag)
+        with self.assertNumQueries(0):
+            not_modified = self.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], etag)
+        self.assertNotEqual(self.get('/api/products/?page_size=1')['ETag'], etag)
+
+    def test_misses_are_read_from_the_primary(self):
+        decisions = []
+        route = PrimaryReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            if model is Product:
+                decisions.append(wants_replica())
+            return route(router, model, **hints)
+
+        view = ProductViewSet.as_view({'get': 'list'})
+        request = APIRequestFactory().get('/api/products/')
+        force_authenticate(request, self.user)
+        with benchmark_environment(), \
+                mock.patch.dict(settings.DATABASES, {REPLICA_DB_ALIAS: {}}), \
+                mock.patch.object(PrimaryReplicaRouter, 'db_for_read', record):
+            response = view(request)
+            # The same recording sees the view's own replica_reads()
+            # when nothing overrides it
+            with replica_reads():
+                Product.objects.first()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(decisions, [False, True])
+
+    def test_product_save_invalidates_cached_responses(self):
+        product = Product.objects.order_by('id').first()
+        path = f'/api/products/{product.pk}/'
+        etag = self.get(path)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            product.name = 'Renamed'
+            product.save()
+        response = self.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['name'], 'Renamed')
+
+    def test_checkout_invalidates_cached_stock(self):
+        product = Product.objects.order_by('id').first()
+        Product.objects.filter(pk=product.pk).update(stock=5)
+        reset_caches()
+        path = f'/api/products/{product.pk}/'
+        etag = self.get(path)['ETag']
+        # Two of five units sold, so nothing sells out
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order({
+                'first_name': 'Cache', 'last_name': 'Check',
+                'email': 'cache@example.com', 'phone_number': '1',
+                'street_address1': '1 Street', 'country': 'IE',
+                'town': 'Town', 'postcode': 'A1',
+            }, [{'product': product.pk, 'quantity': 2}])
+        response = self.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['stock'], 3)
+
+
+class CatalogSyncTests(TestCase):
+    """
+    The sync endpoint returns only what changed after the client's token.
+    """
+
+    def setUp(self):
+        self.user = seed(products=5)
+        self.headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'
+        }
+
+    def change_seq(self, product):
+        return Product.objects.values_list('change_seq', flat=True).get(pk=product.pk)
+
+    def sync(self, **params):
+        with benchmark_environment():
+            response = self.client.get('/api/products/sync/', params, **self.headers)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_changes_since_token(self):
+        first = self.sync()
+        self.assertEqual(len(first['changed']), 5)
+        self.assertFalse(first['more'])
+
+        kept, gone = Product.objects.order_by('id')[:2]
+        # Writes join the feed when they commit
+        with self.captureOnCommitCallbacks(execute=True):
+            kept.price = Decimal('3.00')
+            kept.save()
+        self.assertEqual(self.sync(since=first['token'])['changed'][0]['id'], kept.pk)
+        gone_id = gone.pk
+        gone.delete()
+
+        changes = self.sync(since=first['token'])
+        self.assertEqual([row['id'] for row in changes['changed']], [kept.pk])
+        self.assertEqual(changes['changed'][0]['price'], '3.00')
+        self.assertEqual(changes['deleted'], [gone_id])
+        self.assertEqual(self.sync(since=changes['token'])['changed'], [])
+
+    def test_checkout_renumbers_stock_changes_after_commit(self):
+        product = Product.objects.order_by('id').first()
+        Product.objects.filter(pk=product.pk).update(stock=10)
+        token = self.sync()['token']
+        with self.captureOnCommitCallbacks() as callbacks, \
+                CaptureQueriesContext(connection) as queries:
+            place_order({
+                'first_name': 'Feed', 'last_name': 'Check',
+                'email': 'feed@example.com', 'phone_number': '1',
+                'street_address1': '1 Street', 'country': 'IE',
+                'town': 'Town', 'postcode': 'A1',
+            }, [{'product': product.pk, 'quantity': 1}])
+        # The checkout itself never waits on the sequence row, it only
+        # marks the product pending
+        self.assertFalse(any(
+            CatalogSequence._meta.db_table in query['sql'] for query in queries
+        ))
+        self.assertIsNone(self.change_seq(product))
+        for callback in callbacks:
+            callback()
+        self.assertGreater(self.change_seq(product), token)
+        changed = self.sync(since=token)['changed']
+        self.assertEqual([(row['id'], row['stock']) for row in changed], [(product.pk, 9)])
+
+    def test_queryset_updates_are_renumbered(self):
+        product = Product.objects.order_by('id').first()
+        token = self.sync()['token']
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=product.pk).update(price=Decimal('7.00'))
+        self.assertGreater(self.change_seq(product), token)
+        changed = self.sync(since=token)['changed']
+        self.assertEqual([(row['id'], row['price']) for row in changed], [(product.pk, '7.00')])
+
+    def test_failed_renumber_is_recovered_by_readers(self):
+        token = self.sync()['token']
+        reset_caches()
+        version = get_catalog_version()
+        with mock.patch.object(
+                    CatalogSequence, 'allocate', side_effect=DatabaseError('down')
+                ), \
+                self.assertLogs(level='ERROR'), \
+                self.captureOnCommitCallbacks(execute=True):
+            added = Product.objects.create(name='Added', price=Decimal('2.00'))
+        # The failure didn't stop the version bump registered after it
+        self.assertNotEqual(get_catalog_version(), version)
+        self.assertIsNone(self.change_seq(added))
+        self.assertEqual(
+            quote([{'product': added.pk, 'quantity': 1}]).order_total,
+            Decimal('2.00'),
+            )
+        changed = self.sync(since=token)['changed']
+        self.assertEqual([row['id'] for row in changed], [added.pk])
+        self.assertGreater(self.change_seq(added), token)
+
+    def test_limit_pages_through_changes(self):
+        page = self.sync(limit=2)
+        self.assertTrue(page['more'])
+        seen = [row['id'] for row in page['changed']]
+        while page['more']:
+            page = self.sync(since=page['token'], limit=2)
+            seen += [row['id'] for row in page['changed']]
+        self.assertEqual(seen, list(Product.objects.order_by('id').values_list('id', flat=True)))
+
+
+class CheckoutTests(TestCase):
+    """
+    Checking out through the API runs the same queries for any number of
+    lines.
+    """
+
+    def setUp(self):
+        self.user = seed(products=30)
+        Product.objects.update(stock=5)
+        self.headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'
+        }
+        self.products = list(Product.objects.order_by('id'))
+
+    def checkout(self, products):
+        reset_caches()
+        with benchmark_environment():
+            response = self.client.post('/api/checkout/', {
+                'first_name': 'Line', 'last_name': 'Count',
+                'email': self.user.email, 'phone_number': '1',
+                'street_address1': '1 Street', 'country': 'IE',
+                'town': 'Town', 'postcode': 'A1',
+                'items': [
+                    {'product': product.pk, 'quantity': 2}
+                    for product in products
+                ],
+            }, content_type='application/json', **self.headers)
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def test_query_count_is_independent_of_line_count(self):
+        with self.assertNumQueries(10):
+            one = self.checkout(self.products[:1])
+        with self.assertNumQueries(10):
+            many = self.checkout(self.products[1:26])
+        self.assertEqual(one['item_count'], 2)
+        self.assertEqual(many['item_count'], 50)
+        self.assertEqual(
+            Decimal(many['order_total']),
+            sum(product.price * 2 for product in self.products[1:26]),
+            )
+        self.assertEqual(
+            list(Product.objects.order_by('id').values_list('stock', flat=True)[:27]),
+            [3] * 26 + [5],
+            )
+
+
+class QuoteTests(TestCase):
+    """
+    Quotes match what checkout charges and don't hit the database once
+    the price table is warm.
+    """
+
+    def setUp(self):
+        reset_caches()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cheap = Product.objects.create(name='Cheap', price=Decimal('4.99'))
+            self.dear = Product.objects.create(name='Dear', price=Decimal('30.00'), stock=5)
+        self.items = [
+            {'product': self.cheap.pk, 'quantity': 3},
+            {'product': self.dear.pk, 'quantity': 1},
+        ]
+
+    def test_quote_matches_checkout(self):
+        quoted = quote(self.items)
+        order = place_order({
+            'first_name': 'Quote', 'last_name': 'Check',
+            'email': 'quote@example.com', 'phone_number': '1',
+            'street_address1': '1 Street', 'country': 'IE',
+            'town': 'Town', 'postcode': 'A1',
+        }, self.items)
+        self.assertEqual(
+            (quoted.order_total, quoted.delivery_cost, quoted.total_price),
+            (order.order_total, order.delivery_cost, order.total_price)
+            )
+
+    def test_warm_quotes_run_no_queries(self):
+        quote(self.items)
+        with self.assertNumQueries(0):
+            with benchmark_environment():
+                response = self.client.post(
+                    '/api/quote/', {'items': self.items}, content_type='application/json'
+                    )
+        self.assertEqual(response.json()['total_price'], '49.47')
+
+    def test_product_writes_reach_the_price_table(self):
+        quote(self.items)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dear.price = Decimal('60.00')
+            self.dear.save()
+        self.assertEqual(quote(self.items).total_price, Decimal('74.97'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cheap.delete()
+        with self.assertRaises(ValidationError):
+            quote(self.items)
+
+    def test_quote_rejects_more_than_the_stock(self):
+        too_many = [{'product': self.dear.pk, 'quantity': 6}]
+        with self.assertRaises(ValidationError) as quoted:
+            quote(too_many)
+        with self.assertRaises(ValidationError) as checkout:
+            place_order({
+                'first_name': 'Quote', 'last_name': 'Check',
+                'email': 'quote@example.com', 'phone_number': '1',
+                'street_address1': '1 Street', 'country': 'IE',
+                'town': 'Town', 'postcode': 'A1',
+            }, too_many)
+        self.assertEqual(quoted.exception.detail, checkout.exception.detail)
+        self.assertEqual(
+            quote([{'product': self.dear.pk, 'quantity': 5}]).order_total,
+            Decimal('150.00'),
+            )
+
+    def test_price_table_catches_up_after_max_age(self):
+        quote(self.items)
+        # A price change whose version bump this process never saw
+        with self.captureOnCommitCallbacks(execute=True), \
+                mock.patch('store.signals.bump_catalog_version'):
+            self.dear.price = Decimal('60.00')
+            self.dear.save()
+        self.assertEqual(quote(self.items).total_price, Decimal('49.47'))
+        later = time.monotonic() + settings.PRICE_TABLE_MAX_AGE + 1
+        with mock.patch('store.pricing.time.monotonic', return_value=later):
+            self.assertEqual(quote(self.items).total_price, Decimal('74.97'))
+
+
+class OrderTotalsTests(TestCase):
+    """
+    Line edits shift the stored totals by their difference, with delivery
+    recomputed across the free delivery threshold, and the reconcile
+    command finds and repairs any drift.
+    """
+
+    def setUp(self):
+        self.first, self.second = Product.objects.bulk_create([
+            Product(name='First', price=Decimal('4.00')),
+            Product(name='Second', price=Decimal('30.00')),
+        ])
+        self.order = place_order({
+            'first_name': 'Order', 'last_name': 'Totals',
+            'email': 'totals@example.com', 'phone_number': '1',
+            'street_address1': '1 Street', 'country': 'IE',
+            'town': 'Town', 'postcode': 'A1',
+        }, [{'product': self.first.pk, 'quantity': 2}])
+
+    def totals(self):
+        order = Order.objects.get(pk=self.order.pk)
+        return [getattr(order, field) for field in Order.TOTAL_FIELDS]
+
+    def test_line_edits_adjust_totals(self):
+        self.assertEqual(
+            self.totals(), [Decimal('8.00'), Decimal('0.80'), Decimal('8.80')]
+            )
+        line = OrderItem.objects.create(
+            order=self.order, product=self.second, quantity=1
+            )
+        self.assertEqual(
+            self.totals(), [Decimal('38.00'), Decimal('3.80'), Decimal('41.80')]
+            )
+        # Exactly the threshold is free
+        first = OrderItem.objects.get(order=self.order, product=self.first)
+        first.quantity = 5
+        first.save()
+        self.assertEqual(
+            self.totals(), [Decimal('50.00'), Decimal('0.00'), Decimal('50.00')]
+            )
+        line.delete()
+        self.assertEqual(
+            self.totals(), [Decimal('20.00'), Decimal('2.00'), Decimal('22.00')]
+            )
+
+    def test_adjustments_from_stale_instances_add_up(self):
+        stale = [Order.objects.get(pk=self.order.pk) for _ in range(2)]
+        for order in stale:
+            order.adjust_totals(Decimal('21.00'))
+        self.assertEqual(
+            self.totals(), [Decimal('50.00'), Decimal('0.00'), Decimal('50.00')]
+            )
+        self.assertEqual(stale[1].total_price, Decimal('50.00'))
+        stale[0].adjust_totals(Decimal('-0.01'))
+        self.assertEqual(
+            self.totals(), [Decimal('49.99'), Decimal('5.00'), Decimal('54.99')]
+            )
+
+    def test_reconcile_reports_and_fixes_drift(self):
+        Order.objects.filter(pk=self.order.pk).update(
+            order_total=Decimal('1.00'), total_price=Decimal('1.10')
+            )
+        out = io.StringIO()
+        call_command('reconcile_order_totals', stdout=out)
+        self.assertIn('found 1 mismatched', out.getvalue())
+        self.assertEqual(self.totals()[0], Decimal('1.00'))
+
+        out = io.StringIO()
+        call_command('reconcile_order_totals', fix=True, stdout=out)
+        self.assertIn('fixed 1 mismatched', out.getvalue())
+        self.assertEqual(
+            self.totals(), [Decimal('8.00'), Decimal('0.80'), Decimal('8.80')]
+            )
+        out = io.StringIO()
+        call_command('reconcile_order_totals', stdout=out)
+        self.assertIn('found 0 mismatched', out.getvalue())
+
+
+class SalesRollupTests(TestCase):
+    """
+    The incrementally maintained rollups agree with a full rebuild.
+    """
+
+    def rollup_rows(self):
+        return (
+            sorted(DailySales.objects.filter(orders__gt=0).values_list(
+                'date', 'status', 'orders', 'units',
+                'order_total', 'delivery_cost', 'total_price',
+            )),
+            sorted(DailyProductSales.objects.filter(orders__gt=0).values_list(
+                'date', 'product_id', 'status', 'orders', 'units', 'revenue',
+            )),
+        )
+
+    def test_incremental_rollups_match_rebuild(self):
+        first, second = Product.objects.bulk_create([
+            Product(name='First', price=Decimal('4.99')),
+            Product(name='Second', price=Decimal('30.00')),
+        ])
+        orders = [
+            place_order({
+                'first_name': 'Roll', 'last_name': 'Up',
+                'email': 'rollup@example.com', 'phone_number': '1',
+                'street_address1': '1 Street', 'country': 'IE',
+                'town': 'Town', 'postcode': 'A1',
+            }, items)
+            for items in (
+                [{'product': first.pk, 'quantity': 2}, {'product': second.pk, 'quantity': 1}],
+                [{'product': first.pk, 'quantity': 1}],
+                [{'product': second.pk, 'quantity': 3}],
+            )
+        ]
+        fulfilled = Order.objects.get(pk=orders[1].pk)
+        fulfilled.status = 'fulfilled'
+        fulfilled.save()
+        Order.objects.get(pk=orders[2].pk).delete()
+
+        incremental = self.rollup_rows()
+        self.assertEqual(len(incremental[0]), 2)
+        rebuild()
+        self.assertEqual(self.rollup_rows(), incremental)
+
+    def test_line_edits_after_checkout_keep_rollups_in_step(self):
+        first, second = Product.objects.bulk_create([
+            Product(name='First', price=Decimal('4.99')),
+            Product(name='Second', price=Decimal('30.00')),
+        ])
+        order = place_order({
+            'first_name': 'Roll', 'last_name': 'Up',
+            'email': 'rollup@example.com', 'phone_number': '1',
+            'street_address1': '1 Street', 'country': 'IE',
+            'town': 'Town', 'postcode': 'A1',
+        }, [{'product': first.pk, 'quantity': 2}])
+        # Crosses the free delivery threshold, then drops back under it
+        OrderItem.objects.create(order=order, product=second, quantity=2)
+        line = OrderItem.objects.get(order=order, product=first)
+        line.quantity = 5
+        line.save()
+        line = OrderItem.objects.get(order=order, product=second)
+        line.product = first
+        line.save()
+        OrderItem.objects.get(pk=line.pk).delete()
+        # The status change takes out what the edited lines contribute
+        order = Order.objects.get(pk=order.pk)
+        order.status = 'fulfilled'
+        order.save()
+
+        incremental = self.rollup_rows()
+        self.assertFalse(DailySales.objects.filter(units__lt=0).exists())
+        self.assertFalse(
+            DailyProductSales.objects.filter(revenue__lt=0).exists()
+            )
+        self.assertEqual(
+            incremental[0][0][2:],
+            (1, 5, Decimal('24.95'), order.delivery_cost, order.total_price),
+            )
+        rebuild()
+        self.assertEqual(self.rollup_rows(), incremental)
+
+    def test_deleting_a_sold_product(self):
+        first, second = Product.objects.bulk_create([
+            Product(name='First', price=Decimal('4.00')),
+            Product(name='Second', price=Decimal('30.00')),
+        ])
+        order = place_order({
+            'first_name': 'Roll', 'last_name': 'Up',
+            'email': 'rollup@example.com', 'phone_number': '1',
+            'street_address1': '1 Street', 'country': 'IE',
+            'town': 'Town', 'postcode': 'A1',
+        }, [
+            {'product': first.pk, 'quantity': 2},
+            {'product': second.pk, 'quantity': 1},
+        ])
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get(pk=second.pk).delete()
+        # The deferred foreign keys hold, so the deletion can commit
+        connection.check_constraints()
+
+        order.refresh_from_db()
+        self.assertEqual(order.order_total, Decimal('8.00'))
+        self.assertEqual(order.line_summary, '2 × First')
+        self.assertFalse(
+            DailyProductSales.objects.filter(product_id=second.pk).exists()
+            )
+        incremental = self.rollup_rows()
+        rebuild()
+        self.assertEqual(self.rollup_rows(), incremental)
+
+
+class OrderNumberTests(TestCase):
+    """
+    Order numbers are time-ordered ULIDs that staff and the owner can
+    look orders up by.
+    """
+
+    def test_order_numbers_sort_in_creation_order(self):
+        numbers = [new_ulid() for _ in range(1000)]
+        self.assertEqual(numbers, sorted(numbers))
+        self.assertEqual(len(set(numbers)), len(numbers))
+        self.assertEqual({len(number) for number in numbers}, {26})
+
+    def test_lookup_by_order_number(self):
+        owner = seed(products=1)
+        stranger = User.objects.create_user(username='stranger')
+        order = place_order({
+            'first_name': 'Order', 'last_name': 'Owner',
+            'email': owner.email, 'phone_number': '1',
+            'street_address1': '1 Street', 'country': 'IE',
+            'town': 'Town', 'postcode': 'A1',
+        }, [{'product': Product.objects.get().pk, 'quantity': 2}], owner.customer)
+
+        def lookup(user):
+            with benchmark_environment():
+                return self.client.get(
+                    f'/api/orders/{order.order_number.lower()}/',
+                    HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}',
+                    )
+
+        response = lookup(owner)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['order_number'], order.order_number)
+        self.assertEqual(response.json()['items'][0]['quantity'], 2)
+        self.assertEqual(lookup(stranger).status_code, 404)
+
+
+class OrderBagTests(TestCase):
+    """
+    The bag stays out of order queries unless asked for and decodes to
+    typed lines whatever shape it was migrated in.
+    """
+
+    def test_bag_lines_normalise_legacy_bags(self):
+        cases = [
+            ({'3': 2, '5': '1'}, [(3, 2), (5, 1)]),
+            ([[3, 2], {'product': 5, 'quantity': 1}], [(3, 2), (5, 1)]),
+            ([[3], 'x', {'quantity': 1}, [3, 'two']], []),
+            ('not json', []),
+            (None, []),
+        ]
+        for bag, lines in cases:
+            with self.subTest(bag=bag):
+                self.assertEqual(Order(bag=bag).bag_lines, lines)
+
+    def test_with_bag_keeps_other_deferrals(self):
+        seed(products=1)
+        product = Product.objects.get()
+        order = place_order({
+            'first_name': 'Bag', 'last_name': 'Owner',
+            'email': 'bag@example.com', 'phone_number': '1',
+            'street_address1': '1 Street', 'country': 'IE',
+            'town': 'Town', 'postcode': 'A1',
+        }, [{'product': product.pk, 'quantity': 2}])
+        deferred = Order.objects.defer('line_summary').with_bag().get()
+        self.assertEqual(deferred.get_deferred_fields(), {'line_summary'})
+        only = Order.objects.only('id', 'email').with_bag().get()
+        self.assertIn('status', only.get_deferred_fields())
+        self.assertNotIn('bag', only.get_deferred_fields())
+        with self.assertNumQueries(0):
+            self.assertEqual(only.bag_lines, [(product.pk, 2)])
+        self.assertEqual(only.pk, order.pk)
+
+
+class OrderMigrationTests(TransactionTestCase):
+    """
+    Data migrations keep what existing orders already hold.
+    """
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([('store', target)])
+        return executor.loader.project_state([('store', target)]).apps
+
+    def setUp(self):
+        latest = MigrationExecutor(connection).loader.graph.leaf_nodes('store')
+        self.addCleanup(self.migrate, latest[0][1])
+
+    def test_text_bags_become_json(self):
+        old = self.migrate('0004_order_unclaimed_email_idx')
+        for bag in ['{"3": 2}', '[[3, 2]]', 'not json', '']:
+            old.get_model('store', 'Order').objects.create(
+                order_number=uuid.uuid4().hex.upper(), bag=bag,
+                )
+        new = self.migrate('0005_order_bag_jsonfield')
+        migrated = new.get_model('store', 'Order').objects.order_by('id')
+        self.assertEqual(
+            list(migrated.values_list('bag', flat=True)),
+            [{'3': 2}, [[3, 2]], 'not json', {}],
+            )
+
+    def test_existing_order_numbers_are_kept(self):
+        old = self.migrate('0007_product_change_feed')
+        number = uuid.uuid4().hex.upper()
+        old.get_model('store', 'Order').objects.create(order_number=number)
+        new = self.migrate('0008_order_number_ulid')
+        self.assertEqual(
+            list(new.get_model('store', 'Order').objects.values_list(
+                'order_number', flat=True
+            )),
+            [number],
+            )
+
+
+class OrderHistoryTests(TestCase):
+    """
+    The order history lists the customer's own orders with summaries kept
+    in step with their lines, in the same queries for any page size.
+    """
+
+    def setUp(self):
+        self.user = seed(products=12)
+        self.orders = place_orders(self.user, 6)
+        self.headers = {
+            'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'
+        }
+
+    def history(self, page_size, user=None):
+        headers = self.headers
+        if user:
+            headers = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(user)}'}
+        with benchmark_environment():
+            return self.client.get(f'/api/orders/?page_size={page_size}', **headers)
+
+    def test_list_is_newest_first_with_summaries(self):
+        # user, order page
+        reset_caches()
+        with self.assertNumQueries(2):
+            small = self.history(2)
+        reset_caches()
+        with self.assertNumQueries(2):
+            full = self.history(10)
+        self.assertEqual(len(small.json()['results']), 2)
+        self.assertIsNotNone(small.json()['next'])
+        results = full.json()['results']
+        self.assertEqual(
+            [row['order_number'] for row in results],
+            [order.order_number for order in reversed(self.orders)],
+            )
+        self.assertEqual(results[-1]['item_count'], 15)
+        self.assertEqual(
+            results[-1]['line_summary'],
+            '5 × Product 4, 4 × Product 3, 3 × Product 2 and 2 more',
+            )
+        stranger = User.objects.create_user(username='stranger')
+        self.assertEqual(self.history(10, stranger).json()['results'], [])
+
+    def test_async_list_matches_sync_list(self):
+        Product.objects.bulk_create(
+            Product(name=f'Extra {n}', price=Decimal('1.00')) for n in range(4)
+            )
+        place_orders(self.user, 15, lines=1)
+        with benchmark_environment():
+            sync = self.client.get('/api/orders/', **self.headers).json()
+            default = self.client.get('/api/async/orders/', **self.headers).json()
+            first = self.client.get(
+                '/api/async/orders/?page_size=4', **self.headers
+                ).json()
+            second = self.client.get(first['next'], **self.headers).json()
+            back = self.client.get(second['previous'], **self.headers).json()
+        # The same 20 order page and row shape as OrderListView
+        self.assertEqual(len(sync['results']), 20)
+        self.assertEqual(default['results'], sync['results'])
+        self.assertIsNotNone(default['next'])
+        self.assertEqual(first['results'] + second['results'], sync['results'][:8])
+        self.assertIsNone(first['previous'])
+        self.assertEqual(back['results'], first['results'])
+        self.assertIsNone(back['previous'])
+
+    @override_settings(
+        ALLOWED_HOSTS=['testserver'],
+        THROTTLE_STORE={'BACKEND': 'users.throttling.CacheCounterStore'},
+    )
+    def test_async_views_apply_the_default_throttles(self):
+        reset_caches()
+        with mock.patch.object(UserRateThrottle, 'rate', '2/min', create=True):
+            statuses = [
+                self.client.get(path, **self.headers).status_code
+                for path in ('/api/orders/', '/api/async/orders/',
+                             '/api/async/products/')
+            ]
+        # The sync and async views draw on the same allowance
+        self.assertEqual(statuses, [200, 200, 429])
+
+    def test_summary_follows_line_edits(self):
+        order = self.orders[0]
+        item = order.items.get(quantity=5)
+        item.quantity = 1
+        item.save()
+        order.items.exclude(pk=item.pk).filter(quantity__gt=2).delete()
+        order.refresh_from_db()
+        self.assertEqual(order.item_count, 4)
+        self.assertEqual(
+            order.line_summary, '2 × Product 1, 1 × Product 0, 1 × Product 4'
+            )
+        with benchmark_environment():
+            detail = self.client.get(
+                f'/api/orders/{order.order_number}/', **self.headers
+                ).json()
+        self.assertEqual(detail['item_count'], 4)
+        self.assertEqual(len(detail['items']), 3)
+
+    def test_summary_updates_from_the_edit(self):
+        order = self.orders[0]
+        line = (Product.objects.get(name='Product 0').pk, 1, Decimal('1.00'))
+        # A repriced line leaves both alone
+        with self.assertNumQueries(0):
+            order.update_summary(line, line[:2] + (Decimal('2.00'),))
+        # The line, then the top lines, the line count (more lines follow
+        # than are named) and one UPDATE for the count and summary
+        with self.assertNumQueries(4):
+            order.items.filter(product_id=line[0]).update(quantity=6)
+            order.update_summary(line, (line[0], 6, Decimal('6.00')))
+        order.refresh_from_db()
+        self.assertEqual(order.item_count, 20)
+        self.assertEqual(
+            order.line_summary,
+            '6 × Product 0, 5 × Product 4, 4 × Product 3 and 2 more',
+            )
+
+
+class OrderExportTests(TestCase):
+    """
+    Staff can stream the orders matching a set of filters as CSV or
+    NDJSON.
+    """
+
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', is_staff=True)
+        first, second = Product.objects.bulk_create([
+            Product(name='First', price=Decimal('4.00')),
+            Product(name='Second', price=Decimal('30.00')),
+        ])
+        contact = {
+            'first_name': 'Export', 'last_name': 'Me',
+            'email': 'export@example.com', 'phone_number': '1',
+            'street_address1': '1 Street', 'country': 'IE',
+            'town': 'Town', 'postcode': 'A1',
+        }
+        self.orders = [
+            place_order(contact, [
+                {'product': first.pk, 'quantity': 2},
+                {'product': second.pk, 'quantity': 1},
+            ]),
+            place_order(contact, [{'product': second.pk, 'quantity': 3}]),
+            Order.objects.create(**contact),
+        ]
+        for day, order in enumerate(self.orders, start=1):
+            Order.objects.filter(pk=order.pk).update(
+                date=timezone.make_aware(datetime(2026, 3, day, 12))
+                )
+        Order.objects.filter(pk=self.orders[1].pk).update(status='fulfilled')
+
+    def export(self, query='', user=None):
+        with benchmark_environment():
+            response = self.client.get(
+                f'/api/orders/export/?{query}',
+                HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user or self.staff)}',
+                )
+        if response.status_code == 200:
+            response.text = b''.join(response.streaming_content).decode()
+        return response
+
+    def exported_ids(self, query):
+        lines = self.export(f'output=ndjson&{query}').text.splitlines()
+        return [json.loads(line)['id'] for line in lines]
+
+    def test_csv_has_a_line_per_item(self):
+        response = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.reader(io.StringIO(response.text)))
+        self.assertEqual(rows[0], ORDER_FIELDS + ITEM_FIELDS)
+        first, second, empty = self.orders
+        self.assertEqual(
+            [(row[1], row[-3:]) for row in rows[1:]],
+            [
+                (first.order_number, [str(first.items.get(quantity=2).product_id), '2', '8.00']),
+                (first.order_number, [str(first.items.get(quantity=1).product_id), '1', '30.00']),
+                (second.order_number, [str(second.items.get().product_id), '3', '90.00']),
+                (empty.order_number, ['', '', '']),
+            ],
+            )
+
+    def test_ndjson_nests_items_per_order(self):
+        response = self.export('output=ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual([row['id'] for row in rows], [order.pk for order in self.orders])
+        self.assertEqual(rows[0]['order_total'], '38.00')
+        self.assertEqual(rows[0]['total_price'], '41.80')
+        self.assertEqual(
+            [item['quantity'] for item in rows[0]['items']], [2, 1]
+            )
+        self.assertEqual(rows[2]['items'], [])
+
+    def test_filters(self):
+        first, second, empty = (order.pk for order in self.orders)
+        self.assertEqual(self.exported_ids('date_from=2026-03-02'), [second, empty])
+        self.assertEqual(self.exported_ids('date_to=2026-03-02'), [first, second])
+        self.assertEqual(self.exported_ids('status=fulfilled'), [second])
+        self.assertEqual(self.exported_ids(f'after_id={first}'), [second, empty])
+        self.assertEqual(self.export('status=lost').status_code, 400)
+        customer = User.objects.create_user(username='customer')
+        self.assertEqual(self.export(user=customer).status_code, 403)
+
+
+class GenerateDataTests(TestCase):
+    """
+    The synthetic data generator is reproducible and writes consistent
+    orders.
+    """
+
+    def generate(self, **options):
+        call_command(
+            'generate_data', seed=7, products=30, customers=10, orders=200,
+            guest_ratio=0.5, chunk_size=64, end='2026-01-01T12:00:00',
+            password='password', stdout=io.StringIO(), **options
+            )
+        return list(Order.objects.order_by('id').values_list(
+            'order_number', 'email', 'customer_id', 'date', 'bag', 'total_price',
+        ))
+
+    def test_same_seed_generates_same_rows(self):
+        with transaction.atomic():
+            first = self.generate()
+            transaction.set_rollback(True)
+        self.assertEqual(self.generate(), first)
+        self.assertEqual(len(first), 200)
+        self.assertTrue(any(row[2] is None for row in first))
+        self.assertTrue(any(row[2] is not None for row in first))
+
+    def test_generated_orders_are_consistent(self):
+        self.generate()
+        for order in Order.objects.prefetch_related('items'):
+            items = list(order.items.all())
+            self.assertEqual(
+                {str(item.product_id): item.quantity for item in items}, order.bag
+                )
+            self.assertEqual(sum(item.item_total for item in items), order.order_total)
+            self.assertEqual(order.total_price, order.order_total + order.delivery_cost)
+        rebuilt = sorted(DailySales.objects.values_list('date', 'status', 'total_price'))
+        rebuild()
+        self.assertEqual(
+            sorted(DailySales.objects.values_list('date', 'status', 'total_price')),
+            rebuilt,
+            )
+        # Sequences were moved past the explicit ids
+        Product.objects.create(name='After', price=Decimal('1.00'))
+
+    def test_insert_path_keeps_dates_and_resets_sequences(self):
+        # COPY is only used on PostgreSQL; this covers the INSERT writer
+        # there too
+        rows = self.generate(no_copy=True)
+        dates = [row[3] for row in rows]
+        self.assertEqual(dates, sorted(dates))
+        self.assertLess(dates[0], dates[-1] - timedelta(days=300))
+        self.assertTrue(Order._meta.get_field('date').auto_now_add)
+        User.objects.create_user(username='after')
+        Product.objects.create(name='After', price=Decimal('1.00'))
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class StockReservationConcurrencyTests(TransactionTestCase):
+    """
+    Many checkouts race for the same two products. Needs row locks, so it
+    runs on PostgreSQL and is skipped on SQLite.
+    """
+
+    stock = 50
+    checkouts = 120
+    workers = 16
+
+    def checkout(self, products):
+        # Alternate the cart order so lock ordering is actually exercised
+        items = [{'product': pk, 'quantity': 1} for pk in products]
+        random.shuffle(items)
+        try:
+            place_order({
+                'first_name': 'Flash', 'last_name': 'Sale',
+                'email': 'flash@example.com', 'phone_number': '1',
+                'street_address1': '1 Street', 'country': 'IE',
+                'town': 'Town', 'postcode': 'A1',
+            }, items)
+            return True
+        except ValidationError:
+            return False
+        finally:
+            connection.close()
+
+    def test_parallel_checkouts_never_oversell(self):
+        products = [
+            Product.objects.create(name=name, price=1, stock=self.stock).pk
+            for name in ('Limited A', 'Limited B')
+        ]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(self.workers) as pool:
+            results = list(pool.map(
+                lambda _: self.checkout(products), range(self.checkouts)
+            ))
+        elapsed = time.perf_counter() - started
+        connections.close_all()
+
+        self.assertEqual(sum(results), self.stock)
+        self.assertEqual(
+            list(Product.objects.filter(pk__in=products).values_list('stock', flat=True)),
+            [0, 0]
+        )
+        self.assertEqual(OrderItem.objects.count(), 2 * self.stock)
+        self.assertFalse(Product.objects.get(pk=products[0]).in_stock)
+        self.assertGreater(self.checkouts / elapsed, 20)
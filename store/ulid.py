@@ -0,0 +1,59 @@
+"""
+ULID generation for order numbers.
+
+A ULID is a 48-bit millisecond timestamp followed by 80 random bits,
+written as 26 Crockford base32 characters. Because the timestamp leads,
+ULIDs sort by creation time, so new keys land at the right-hand edge of
+an index instead of at random pages, and the random part makes collisions
+between processes vanishingly unlikely.
+"""
+import secrets
+import threading
+import time
+
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+LENGTH = 26
+RANDOM_BITS = 80
+
+_lock = threading.Lock()
+_last_ms = 0
+_last_random = 0
+
+
+def encode(value):
+    chars = []
+    for _ in range(LENGTH):
+        value, index = divmod(value, 32)
+        chars.append(ALPHABET[index])
+    return ''.join(reversed(chars))
+
+
+def new_ulid(timestamp=None):
+    """
+    Return a new ULID string.
+
+    Without ``timestamp`` the current time is used, and ULIDs made by this
+    process in the same millisecond increment the random part so they
+    still sort in creation order.
+
+    Args:
+        timestamp (datetime): Optional time to embed instead of now.
+    """
+    global _last_ms, _last_random
+    if timestamp is not None:
+        ms = int(timestamp.timestamp() * 1000)
+        return encode((ms << RANDOM_BITS) | secrets.randbits(RANDOM_BITS))
+
+    with _lock:
+        ms = time.time_ns() // 1_000_000
+        if ms <= _last_ms:
+            ms = _last_ms
+            random = _last_random + 1
+            if random >> RANDOM_BITS:
+                # Random part exhausted within one millisecond
+                ms += 1
+                random = secrets.randbits(RANDOM_BITS)
+        else:
+            random = secrets.randbits(RANDOM_BITS)
+        _last_ms, _last_random = ms, random
+    return encode((ms << RANDOM_BITS) | random)
@@ -1,11 +1,47 @@
 # store/urls.py
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ProductViewSet
+from . import async_views
+from .views import (
+    CheckoutView,
+    DailySalesReportView,
+    OrderDetailView,
+    OrderExportView,
+    OrderListView,
+    ProductSalesReportView,
+    ProductViewSet,
+    QuoteView,
+)
 
 router = DefaultRouter()
 router.register(r'products', ProductViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('checkout/', CheckoutView.as_view(), name='checkout'),
+    path('quote/', QuoteView.as_view(), name='quote'),
+    path('orders/', OrderListView.as_view(), name='order-list'),
+    path('orders/export/', OrderExportView.as_view(), name='order-export'),
+    path(
+        'reports/daily-sales/',
+        DailySalesReportView.as_view(),
+        name='report-daily-sales'
+        ),
+    path(
+        'reports/product-sales/',
+        ProductSalesReportView.as_view(),
+        name='report-product-sales'
+        ),
+    path(
+        'orders/<str:order_number>/',
+        OrderDetailView.as_view(),
+        name='order-detail'
+        ),
+    path('async/products/', async_views.product_list, name='async-product-list'),
+    path(
+        'async/products/<int:pk>/',
+        async_views.product_detail,
+        name='async-product-detail'
+        ),
+    path('async/orders/', async_views.order_list, name='async-order-list'),
 ]
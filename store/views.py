@@ -1,9 +1,215 @@
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
-from rest_framework import viewsets
-from .models import Product
-from .serializers import ProductSerializer
+from rest_framework import generics, viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from config.db_routers import ReplicaReadMixin, replica_reads
+from users.idempotency import IdempotencyMixin
+from users.throttling import ScopedRateThrottle
+from .cache import CatalogCacheMixin
+from .exports import export_orders, stream_csv, stream_ndjson
+from .services import catalog_changes
+from .models import Order, OrderItem, Product
+from .pagination import OrderCursorPagination, ProductCursorPagination
+from .pricing import quote
+from .renderers import FastJSONRenderer
+from .rollups import daily_sales, product_sales
+from .serializers import (
+    CatalogSyncSerializer,
+    CheckoutSerializer,
+    DailySalesSerializer,
+    OrderDetailSerializer,
+    OrderExportFilterSerializer,
+    OrderListSerializer,
+    ProductSalesSerializer,
+    ProductSerializer,
+    QuoteRequestSerializer,
+    SalesReportFilterSerializer,
+    product_values_serializer,
+)
+
+
+class ValuesListMixin:
+    """
+    Serve the list action from ``.values()`` rows through
+    ``values_serializer`` instead of model instances and
+    ``serializer_class``, with the same output.
+    """
+    values_serializer = None
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset()).values(
+            *self.values_serializer.columns
+            )
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.values_serializer.many(page))
+        return Response(self.values_serializer.many(queryset))
+
 
 # Create your views here.
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(
+        CatalogCacheMixin, ReplicaReadMixin, ValuesListMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    values_serializer = product_values_serializer
+    pagination_class = ProductCursorPagination
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    @action(detail=False, methods=['get'])
+    def sync(self, request):
+        """
+        Products changed and deleted since the ``since`` token, up to
+        ``limit`` of them. Start with no token, then pass back the
+        returned ``token`` until ``more`` is false.
+        """
+        params = CatalogSyncSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        with replica_reads(request):
+            changes = catalog_changes(
+                params.validated_data['since'],
+                params.validated_data['limit'],
+                self.values_serializer.columns,
+                )
+        changes['changed'] = self.values_serializer.many(changes['changed'])
+        return Response(changes)
+
+
+class CheckoutView(IdempotencyMixin, generics.CreateAPIView):
+    """
+    Create an order from a cart in one transaction.
+
+    Guests may check out; orders placed by an authenticated user are
+    attached to their customer profile. Retries sent with the same
+    Idempotency-Key get the first response instead of a second order.
+    """
+    serializer_class = CheckoutSerializer
+    permission_classes = [AllowAny]
+
+    def perform_create(self, serializer):
+        customer = None
+        if self.request.user.is_authenticated:
+            customer = getattr(self.request.user, 'customer', None)
+        serializer.save(customer=customer)
+
+
+class QuoteView(APIView):
+    """
+    Price a cart with checkout's rules, delivery included, without
+    creating an order. Answered from the in-process price table, so
+    repeat quotes don't touch the database.
+    """
+    permission_classes = [AllowAny]
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = 'quote'
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def post(self, request):
+        cart = QuoteRequestSerializer(data=request.data)
+        cart.is_valid(raise_exception=True)
+        return Response(quote(cart.validated_data['items']).as_dict())
+
+
+class OrderListView(ReplicaReadMixin, generics.ListAPIView):
+    """
+    The authenticated customer's orders, newest first.
+
+    Each order carries its item count and line summary, kept up to date
+    when its lines change, so a page is read from the order rows alone:
+    the same queries whatever the page size. Fetch an order's lines from
+    OrderDetailView.
+    """
+    serializer_class = OrderListSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = OrderCursorPagination
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def get_queryset(self):
+        return Order.objects.filter(customer__user=self.request.user).only(
+            'id', *OrderListSerializer.Meta.fields
+            )
+
+
+class OrderDetailView(generics.RetrieveAPIView):
+    """
+    Look an order up by its order number, a seek on its unique index.
+
+    Staff can fetch any order; customers only their own.
+    """
+    serializer_class = OrderDetailSerializer
+    permission_classes = [IsAuthenticated]
+    lookup_field = 'order_number'
+
+    def get_queryset(self):
+        orders = Order.objects.prefetch_related(
+            Prefetch('items', OrderItem.objects.select_related('product').order_by('id'))
+            )
+        if self.request.user.is_staff:
+            return orders
+        return orders.filter(customer__user=self.request.user)
+
+    def get_object(self):
+        # ULIDs are case-insensitive; stored ones are upper case
+        self.kwargs['order_number'] = self.kwargs['order_number'].upper()
+        return super().get_object()
+
+
+class OrderExportView(APIView):
+    """
+    Stream every order matching the query parameters, with its items, as
+    CSV (one line per item) or NDJSON (one order per line).
+
+    Orders are emitted in id order; pass the last id received as
+    ``after_id`` to resume an interrupted export.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        filters = OrderExportFilterSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        orders = export_orders(filters.validated_data)
+        if filters.validated_data['output'] == 'ndjson':
+            return StreamingHttpResponse(
+                stream_ndjson(orders),
+                content_type='application/x-ndjson'
+                )
+        response = StreamingHttpResponse(
+            stream_csv(orders),
+            content_type='text/csv'
+            )
+        response['Content-Disposition'] = 'attachment; filename="orders.csv"'
+        return response
+
+
+class DailySalesReportView(APIView):
+    """
+    Orders, units, revenue and delivery share per day, read from the
+    DailySales rollup only.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        filters = SalesReportFilterSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        rows = daily_sales(filters.validated_data)
+        return Response(DailySalesSerializer(rows, many=True).data)
+
+
+class ProductSalesReportView(APIView):
+    """
+    Units and revenue per product over a date range, best sellers first,
+    read from the DailyProductSales rollup only.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        filters = SalesReportFilterSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        rows = product_sales(
+            filters.validated_data, filters.validated_data['limit']
+            )
+        return Response(ProductSalesSerializer(rows, many=True).data)
@@ -0,0 +1,396 @@
+"""
+Benchmark scenarios and query budgets for the store and users APIs.
+
+Each scenario drives one endpoint through the test client. The
+benchmark_api command times them against seeded data, and the test suite
+pins their query counts to ``budget`` so a change that adds queries fails.
+This is test tooling (it patches APIView and uses django.test), so it
+lives outside the apps and only the tests and benchmark commands import
+it.
+"""
+import statistics
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+from unittest import mock
+from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.signals import user_logged_in
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework.views import APIView
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from store.cache import bump_catalog_version, guest_orders_key
+from store.models import Order, Product
+from store.pricing import price_table
+from store.renderers import FastJSONRenderer
+from store.serializers import ProductSerializer, product_values_serializer
+from store.services import place_order
+from store.ulid import new_ulid
+from users.authentication import user_cache
+from users.models import PasswordResetToken
+
+User = get_user_model()
+
+PASSWORD = 'benchmark-password'
+
+
+def seed(products=1000):
+    """
+    Create the catalog and the user the scenarios authenticate as.
+    """
+    Product.objects.bulk_create(
+        Product(
+            name=f'Product {n}',
+            description=f'Description of product {n}',
+            price=Decimal(n % 200) + Decimal('0.99'),
+        )
+        for n in range(products)
+    )
+    bump_catalog_version()
+    return User.objects.create_user(
+        username='benchmark', email='benchmark@example.com', password=PASSWORD
+    )
+
+
+def place_orders(user, count, lines=5):
+    """
+    Check out ``count`` orders of ``lines`` lines each for ``user``.
+    """
+    products = list(Product.objects.values_list('id', flat=True)[:count + lines])
+    return [
+        place_order({
+            'first_name': 'Bench', 'last_name': 'Mark', 'email': user.email,
+            'phone_number': '1', 'street_address1': '1 Street',
+            'country': 'IE', 'town': 'Town', 'postcode': 'A1',
+        }, [
+            {'product': pk, 'quantity': 1 + line}
+            for line, pk in enumerate(products[n:n + lines])
+        ], user.customer)
+        for n in range(count)
+    ]
+
+
+def reset_caches():
+    """
+    Empty every cache a scenario could hit, for cold-path measurements.
+    """
+    cache.clear()
+    user_cache.clear()
+    price_table.clear()
+
+
+@contextmanager
+def benchmark_environment():
+    """
+    Let the test client through ALLOWED_HOSTS and switch off throttling,
+    so the scenarios measure the views rather than the rate limits.
+    """
+    with override_settings(ALLOWED_HOSTS=['testserver']), \
+            mock.patch.object(APIView, 'get_throttles', return_value=[]):
+        yield
+
+
+class Scenario:
+    """
+    One endpoint exercise. prepare() runs untimed before each run().
+    """
+    name = ''
+    budget = 0
+    status_code = 200
+
+    def __init__(self, user):
+        self.user = user
+        self.client = APIClient()
+
+    def prepare(self, n):
+        pass
+
+    def run(self, n):
+        raise NotImplementedError
+
+    def auth(self):
+        return {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+
+
+class ProductList(Scenario):
+    name = 'product list'
+    # user, product page
+    budget = 2
+
+    def prepare(self, n):
+        self.headers = self.auth()
+
+    def run(self, n):
+        return self.client.get('/api/products/', **self.headers)
+
+
+class ProductDetail(Scenario):
+    name = 'product detail'
+    # user, product
+    budget = 2
+
+    def prepare(self, n):
+        self.headers = self.auth()
+        self.pk = Product.objects.order_by('id').values_list('pk', flat=True)[0]
+
+    def run(self, n):
+        return self.client.get(f'/api/products/{self.pk}/', **self.headers)
+
+
+class CartQuote(Scenario):
+    name = 'cart quote'
+    # price table load; none once it is warm
+    budget = 1
+
+    def prepare(self, n):
+        if not hasattr(self, 'items'):
+            self.items = [
+                {'product': pk, 'quantity': quantity}
+                for quantity, pk in enumerate(
+                    Product.objects.order_by('id').values_list('pk', flat=True)[:10],
+                    start=1,
+                )
+            ]
+
+    def run(self, n):
+        return self.client.post('/api/quote/', {'items': self.items}, format='json')
+
+
+class Checkout(Scenario):
+    name = 'checkout'
+    # user, customer, savepoint, products FOR UPDATE, UPDATE stock,
+    # INSERT order, INSERT items, INSERT product rollups, INSERT day
+    # rollup, release savepoint; the same for any number of lines
+    budget = 10
+    status_code = 201
+    lines = 10
+
+    def prepare(self, n):
+        self.headers = self.auth()
+        if not hasattr(self, 'order'):
+            products = list(
+                Product.objects.order_by('id').values_list('pk', flat=True)[:self.lines]
+            )
+            # Tracked stock, so the timed runs include the reservation
+            Product.objects.filter(pk__in=products).update(stock=10 ** 9)
+            self.order = {
+                'first_name': 'Bench', 'last_name': 'Mark',
+                'email': self.user.email, 'phone_number': '1',
+                'street_address1': '1 Street', 'country': 'IE',
+                'town': 'Town', 'postcode': 'A1',
+                'items': [{'product': pk, 'quantity': 1} for pk in products],
+            }
+
+    def run(self, n):
+        return self.client.post(
+            '/api/checkout/', self.order, format='json', **self.headers
+            )
+
+
+class OrderHistory(Scenario):
+    name = 'order history'
+    # user, order page; the same for any page size
+    budget = 2
+    orders = 25
+
+    def prepare(self, n):
+        self.headers = self.auth()
+        if not hasattr(self, 'placed'):
+            self.placed = place_orders(self.user, self.orders)
+
+    def run(self, n):
+        return self.client.get('/api/orders/?page_size=20', **self.headers)
+
+
+class OrderDetail(OrderHistory):
+    name = 'order detail'
+    # user, order, items with their products
+    budget = 3
+    orders = 1
+
+    def run(self, n):
+        return self.client.get(
+            f'/api/orders/{self.placed[0].order_number}/', **self.headers
+            )
+
+
+class TokenObtain(Scenario):
+    name = 'token obtain'
+    # user
+    budget = 1
+
+    def run(self, n):
+        return self.client.post('/api/token/', {
+            'username': self.user.username,
+            'password': PASSWORD,
+        })
+
+
+class TokenRefresh(Scenario):
+    name = 'token refresh'
+    # user
+    budget = 1
+
+    def prepare(self, n):
+        self.refresh = str(RefreshToken.for_user(self.user))
+
+    def run(self, n):
+        return self.client.post('/api/token/refresh/', {'refresh': self.refresh})
+
+
+class Register(Scenario):
+    name = 'register'
+    # username check, INSERT user, INSERT customer
+    budget = 3
+    status_code = 201
+
+    def run(self, n):
+        return self.client.post('/api/register/', {
+            'username': f'register-{n}-{time.monotonic_ns()}',
+            'password': PASSWORD,
+        })
+
+
+class PasswordResetRequest(Scenario):
+    name = 'password reset request'
+    # email check, user, DELETE old tokens, INSERT token, INSERT email
+    budget = 5
+
+    def run(self, n):
+        return self.client.post('/password-reset/', {'email': self.user.email})
+
+
+class PasswordResetConfirm(Scenario):
+    name = 'password reset confirm'
+    # token with its user, UPDATE password, DELETE token
+    budget = 3
+
+    def prepare(self, n):
+        self.token = PasswordResetToken.objects.create(user=self.user).token
+
+    def run(self, n):
+        return self.client.post('/password-reset/confirm/', {
+            'token': str(self.token),
+            'new_password': PASSWORD,
+        })
+
+
+class GuestOrderClaimLogin(Scenario):
+    name = 'login claiming guest orders'
+    # user, UPDATE last_login, customer, UPDATE orders
+    budget = 4
+    guest_orders = 3
+
+    def prepare(self, n):
+        if not hasattr(self, 'password_hash'):
+            self.password_hash = make_password(PASSWORD)
+        self.username = f'claim-{n}-{time.monotonic_ns()}'
+        email = f'{self.username}@example.com'
+        User.objects.create(
+            username=self.username, email=email, password=self.password_hash
+        )
+        Order.objects.bulk_create(
+            Order(
+                order_number=new_ulid(),
+                first_name='Guest', last_name='Buyer', email=email,
+                phone_number='1', street_address1='1 Street', country='IE',
+                town='Town', postcode='A1',
+            )
+            for _ in range(self.guest_orders)
+        )
+        # bulk_create bypasses Order.save(), which would do this itself
+        cache.delete(guest_orders_key(email))
+
+    def run(self, n):
+        # What django.contrib.auth.login() does, minus the session writes
+        user = authenticate(username=self.username, password=PASSWORD)
+        user_logged_in.send(sender=User, request=None, user=user)
+        return None
+
+
+SCENARIOS = [
+    ProductList,
+    ProductDetail,
+    CartQuote,
+    Checkout,
+    OrderHistory,
+    OrderDetail,
+    TokenObtain,
+    TokenRefresh,
+    Register,
+    PasswordResetRequest,
+    PasswordResetConfirm,
+    GuestOrderClaimLogin,
+]
+
+
+def check_response(scenario, response):
+    if response is not None and response.status_code != scenario.status_code:
+        raise AssertionError(
+            f'{scenario.name} returned {response.status_code}, '
+            f'expected {scenario.status_code}'
+        )
+
+
+def time_scenario(scenario, iterations):
+    """
+    Run a scenario ``iterations`` times with warm caches.
+
+    Returns:
+        tuple: Per-run latencies in seconds and their total.
+    """
+    latencies = []
+    for n in range(iterations):
+        scenario.prepare(n)
+        started = time.perf_counter()
+        response = scenario.run(n)
+        latencies.append(time.perf_counter() - started)
+        check_response(scenario, response)
+    return latencies, sum(latencies)
+
+
+def render_page_with_serializer(queryset):
+    """
+    A product page the way ProductSerializer and JSONRenderer build it.
+    """
+    return JSONRenderer().render(ProductSerializer(queryset, many=True).data)
+
+
+def render_page_with_values(queryset):
+    """
+    The same page through the ``.values()`` fast path and FastJSONRenderer.
+    """
+    rows = queryset.values(*product_values_serializer.columns)
+    return FastJSONRenderer().render(product_values_serializer.many(rows))
+
+
+def time_render(render, queryset, iterations):
+    """
+    Fetch, serialize and render ``queryset`` ``iterations`` times.
+
+    Returns:
+        tuple: Per-run latencies in seconds, their total and the bytes
+        of the last run.
+    """
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        body = render(queryset.all())
+        latencies.append(time.perf_counter() - started)
+    return latencies, sum(latencies), body
+
+
+def format_latencies(name, latencies, elapsed):
+    """
+    One report line with throughput and p50/p95/p99 latency.
+    """
+    cuts = statistics.quantiles(latencies, n=100)
+    return (
+        f"{name:<28} {len(latencies) / elapsed:8.1f} req/s  "
+        f"p50 {cuts[49] * 1000:7.2f} ms  "
+        f"p95 {cuts[94] * 1000:7.2f} ms  "
+        f"p99 {cuts[98] * 1000:7.2f} ms"
+    )
@@ -0,0 +1,141 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+class UserCache:
+    """
+    Thread-safe, in-process LRU cache of User rows with a TTL.
+
+    Entries are evicted on User save and delete in this process (see
+    users.signals). Other worker processes keep serving their copy until
+    its TTL runs out, so keep JWT_USER_CACHE_TTL short. Ids are keyed as
+    strings, the form they take in token claims.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        user_id = str(user_id)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[1] < time.monotonic():
+                self._entries.pop(user_id, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+        # Hand out a copy so one request can't mutate another's user
+        return copy.copy(entry[0])
+
+    def set(self, user_id, user):
+        user_id = str(user_id)
+        with self._lock:
+            self._entries[user_id] = (
+                copy.copy(user), time.monotonic() + self.ttl
+                )
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def evict(self, user_id):
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+            }
+
+
+user_cache = UserCache(
+    maxsize=settings.JWT_USER_CACHE_SIZE,
+    ttl=settings.JWT_USER_CACHE_TTL,
+)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves the token's user from user_cache,
+    only querying the database on a miss.
+    """
+
+    def get_user(self, validated_token):
+        user = self.get_cached_user(validated_token)
+        if user is None:
+            user = self.fetch_user(validated_token)
+        return user
+
+    def get_cached_user(self, validated_token):
+        """
+        Return the token's user from user_cache, or None on a miss.
+        """
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        user = user_cache.get(user_id) if user_id is not None else None
+        if user is None:
+            return None
+
+        # The cached row has passed these checks before, but the token
+        # being presented may not have.
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(
+                _("User is inactive"), code="user_inactive"
+            )
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."),
+                    code="password_changed"
+                )
+        return user
+
+    def fetch_user(self, validated_token):
+        """
+        Load the token's user from the database and cache it.
+        """
+        user = super().get_user(validated_token)
+        user_cache.set(validated_token[api_settings.USER_ID_CLAIM], user)
+        return user
+
+    async def aauthenticate(self, request):
+        """
+        Async counterpart of authenticate() for plain Django async views.
+        Cache hits are resolved on the event loop; only a miss pays a
+        thread hop for the database lookup.
+        """
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        user = self.get_cached_user(validated_token)
+        if user is None:
+            user = await sync_to_async(self.fetch_user)(validated_token)
+        return user, validated_token
@@ -0,0 +1,251 @@
+"""
+Idempotency keys for POSTs that clients retry.
+
+A client that sends an ``Idempotency-Key`` header (any unique string,
+such as a UUID) on a POST can safely resend it: the first request runs
+and its response is stored, and every retry with the same key, client
+and endpoint gets that stored response back without the view running
+again. The client is the user, or for anonymous requests the address
+DRF's throttles identify them by. A retry that arrives while the first
+request is still running waits for its response rather than running
+alongside it. Reusing a key with a different body is an error.
+
+Keys live in the IdempotencyKey table, whose unique index lets exactly
+one of several concurrent requests claim a key. On PostgreSQL the
+request that claims a key also holds an advisory lock on it until its
+response is stored, so a retry waits on that lock instead of polling,
+and a free lock on an unfinished key means its request died. Other
+databases poll. Records expire after IDEMPOTENCY_KEY_TTL, and
+purge_idempotency_keys deletes them.
+"""
+import hashlib
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.throttling import BaseThrottle
+from .models import IdempotencyKey
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL = 0.05
+
+
+class IdempotencyKeyInUse(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'A request with this Idempotency-Key is still in progress.'
+    default_code = 'idempotency_key_in_use'
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'This Idempotency-Key was already used with a different request.'
+    default_code = 'idempotency_key_reused'
+
+
+class Replay(Exception):
+    """
+    Raised from the view's initial() to answer with a stored response.
+    """
+
+    def __init__(self, record):
+        super().__init__()
+        self.record = record
+
+    def response(self):
+        response = HttpResponse(
+            bytes(self.record.content),
+            status=self.record.status_code,
+            content_type=self.record.content_type or None,
+            )
+        response[REPLAYED_HEADER] = 'true'
+        return response
+
+
+def _hash(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _uses_locks():
+    return connection.vendor == 'postgresql'
+
+
+def _lock(function, key):
+    with connection.cursor() as cursor:
+        # The first 60 bits of the hashed key, as a bigint lock id
+        cursor.execute(f'SELECT {function}(%s)', [int(key[:15], 16)])
+        return cursor.fetchone()[0]
+
+
+def release(key):
+    """
+    Release the claim lock on ``key`` once its response is stored.
+    """
+    if _uses_locks():
+        _lock('pg_advisory_unlock', key)
+
+
+def wait(key, deadline):
+    """
+    Wait for the request holding ``key`` to finish, until ``deadline``.
+
+    Returns:
+        bool: False if nothing held the key's lock, so its holder is
+        gone; True once it may have finished.
+
+    Raises:
+        IdempotencyKeyInUse: The deadline passed first.
+    """
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise IdempotencyKeyInUse()
+    if not _uses_locks():
+        time.sleep(min(POLL_INTERVAL, remaining))
+        return True
+    try:
+        with transaction.atomic():
+            # A shared lock, released with the transaction, is enough to
+            # wait for the holder's exclusive one
+            if _lock('pg_try_advisory_xact_lock_shared', key):
+                return False
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT set_config('lock_timeout', %s, true)",
+                    [f'{max(int(remaining * 1000), 1)}ms'],
+                    )
+            _lock('pg_advisory_xact_lock_shared', key)
+    except OperationalError:
+        raise IdempotencyKeyInUse()
+    return True
+
+
+def claim(key, fingerprint):
+    """
+    Claim ``key`` for a new request, or find out what became of the
+    request that claimed it first.
+
+    Returns:
+        IdempotencyKey: The new, in-flight record, when this request is
+        the first to use the key and should run. Pass its key to
+        release() once the response is stored.
+
+    Raises:
+        Replay: The first request finished; answer with its response.
+        IdempotencyKeyInUse: The first request is still running and
+            didn't finish within IDEMPOTENCY_WAIT.
+        IdempotencyKeyReused: The key was used for a different body.
+    """
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT
+    while True:
+        now = timezone.now()
+        try:
+            record = IdempotencyKey.objects.get(key=key)
+        except IdempotencyKey.DoesNotExist:
+            # Lock first, so a claimed key is never seen unlocked while
+            # its request runs
+            if _uses_locks() and not _lock('pg_try_advisory_lock', key):
+                wait(key, deadline)
+                continue
+            try:
+                with transaction.atomic():
+                    return IdempotencyKey.objects.create(
+                        key=key,
+                        fingerprint=fingerprint,
+                        expires_at=now + timedelta(
+                            seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT
+                            ),
+                        )
+            except IntegrityError:
+                # A concurrent duplicate claimed it first
+                release(key)
+                continue
+        if record.expires_at <= now:
+            # Past its TTL, or its request died. Only one of several
+            # duplicates deletes it; they race for the new claim above
+            IdempotencyKey.objects.filter(pk=record.pk, expires_at__lte=now).delete()
+            continue
+        if record.fingerprint != fingerprint:
+            raise IdempotencyKeyReused()
+        if record.status_code is not None:
+            raise Replay(record)
+        if not wait(key, deadline):
+            # Its request died without releasing the key
+            IdempotencyKey.objects.filter(
+                pk=record.pk, status_code__isnull=True
+                ).delete()
+
+
+class IdempotencyMixin:
+    """
+    APIView mixin that runs each POST carrying an Idempotency-Key header
+    at most once per key, client and endpoint, replaying the stored
+    response to retries.
+
+    The key is claimed after authentication, permissions and throttling,
+    so rejected requests don't use it up. Responses with a 5xx status,
+    and unhandled errors, release the key so the client can retry.
+    """
+    idempotency_record = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        key = request.META.get(HEADER)
+        if request.method != 'POST' or not key:
+            return
+        if len(key) > MAX_KEY_LENGTH:
+            raise ValidationError(
+                {'Idempotency-Key': f'Ensure this header has at most {MAX_KEY_LENGTH} characters.'}
+                )
+        if request.user.is_authenticated:
+            client = f'user:{request.user.pk}'
+        else:
+            client = f'anon:{BaseThrottle().get_ident(request)}'
+        self.idempotency_record = claim(
+            _hash(key, client, request.method, request.path),
+            # Read before the parsers consume the stream
+            _hash(request._request.body),
+            )
+
+    def handle_exception(self, exc):
+        if isinstance(exc, Replay):
+            return exc.response()
+        try:
+            return super().handle_exception(exc)
+        except Exception:
+            self.release_idempotency_key()
+            raise
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        record, self.idempotency_record = self.idempotency_record, None
+        if record is None:
+            return response
+        if response.status_code >= 500 or getattr(response, 'streaming', False):
+            IdempotencyKey.objects.filter(pk=record.pk).delete()
+            release(record.key)
+            return response
+        if hasattr(response, 'render'):
+            response.render()
+        IdempotencyKey.objects.filter(pk=record.pk).update(
+            status_code=response.status_code,
+            content=response.content,
+            content_type=response.get('Content-Type', ''),
+            expires_at=timezone.now() + settings.IDEMPOTENCY_KEY_TTL,
+            )
+        release(record.key)
+        return response
+
+    def release_idempotency_key(self):
+        record, self.idempotency_record = self.idempotency_record, None
+        if record is not None:
+            IdempotencyKey.objects.filter(pk=record.pk).delete()
+            release(record.key)
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from users.models import PasswordResetToken
+from users.purging import purge_in_batches
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired password reset tokens in small batches, each its "
+        "own short transaction, so the table doesn't grow without bound."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of tokens deleted per statement.',
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0,
+            help='Seconds to sleep between batches.',
+        )
+
+    def handle(self, *args, **options):
+        deleted = purge_in_batches(
+            PasswordResetToken.objects.expired(), 'created_at',
+            options['batch_size'], options['pause'],
+            )
+        self.stdout.write(f"Deleted {deleted} expired password reset tokens.")
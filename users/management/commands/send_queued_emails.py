@@ -0,0 +1,134 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from users.models import OutboundEmail
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver queued transactional emails in batches over a single "
+        "reused mail connection, retrying failures with backoff."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Number of emails claimed and sent per batch.',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the due emails and exit instead of polling.',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='Seconds to sleep when the outbox is empty.',
+        )
+
+    def handle(self, *args, **options):
+        connection = get_connection()
+        try:
+            while True:
+                sent, failed = self.send_batch(
+                    connection, options['batch_size']
+                    )
+                if sent or failed:
+                    self.stdout.write(f"Sent {sent}, failed {failed}.")
+                    continue
+                if options['once']:
+                    break
+                connection.close()
+                time.sleep(options['interval'])
+        finally:
+            connection.close()
+
+    def send_batch(self, connection, batch_size):
+        """
+        Claim up to ``batch_size`` due emails and try to deliver them.
+
+        The batch is claimed in a short transaction of its own: rows are
+        locked with SKIP LOCKED where the database supports it, their
+        attempt is counted and they are hidden from other workers for
+        EMAIL_CLAIM_TIMEOUT. The mail server is only talked to after that
+        commits, so no row locks are held while it is slow, and the
+        outcome is written in a second transaction. A worker that dies
+        mid-batch leaves its emails to be retried once the claim lapses.
+
+        Returns:
+            tuple: Number of emails sent and number that failed.
+        """
+        batch = self.claim_batch(batch_size)
+        sent = failed = 0
+        if not batch:
+            return sent, failed
+        try:
+            connection.open()
+            connection_error = None
+        except Exception as exc:
+            # Record the outage against the batch so it backs off too
+            connection_error = exc
+        for email in batch:
+            try:
+                if connection_error:
+                    raise connection_error
+                email.to_message(connection=connection).send()
+            except Exception as exc:
+                failed += 1
+                email.last_error = repr(exc)
+                if email.attempts >= settings.EMAIL_MAX_ATTEMPTS:
+                    email.status = OutboundEmail.FAILED
+                else:
+                    email.next_attempt_at = timezone.now() + timedelta(
+                        seconds=settings.EMAIL_RETRY_BACKOFF
+                        * 2 ** (email.attempts - 1)
+                    )
+            else:
+                sent += 1
+                email.status = OutboundEmail.SENT
+                email.sent_at = timezone.now()
+        with transaction.atomic():
+            OutboundEmail.objects.bulk_update(batch, [
+                'status', 'next_attempt_at', 'last_error', 'sent_at',
+            ])
+        return sent, failed
+
+    def claim_batch(self, batch_size):
+        """
+        Lock up to ``batch_size`` due emails, count an attempt against
+        each and push them out of reach of other workers, then commit.
+
+        Returns:
+            list: The claimed emails, as stored after the claim.
+        """
+        now = timezone.now()
+        claimed_until = now + timedelta(seconds=settings.EMAIL_CLAIM_TIMEOUT)
+        with transaction.atomic():
+            batch = list(
+                OutboundEmail.objects
+                .select_for_update(skip_locked=True)
+                .filter(
+                    status=OutboundEmail.PENDING,
+                    next_attempt_at__lte=now,
+                )
+                .order_by('next_attempt_at')[:batch_size]
+            )
+            if batch:
+                OutboundEmail.objects.filter(
+                    pk__in=[email.pk for email in batch]
+                ).update(
+                    attempts=F('attempts') + 1,
+                    next_attempt_at=claimed_until,
+                    )
+        for email in batch:
+            email.attempts += 1
+            email.next_attempt_at = claimed_until
+        return batch
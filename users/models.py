@@ -1,9 +1,10 @@
 import uuid
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
 from django.db import models
+from django.utils import timezone
 from django_countries.fields import CountryField
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
-from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -26,23 +27,155 @@ class Customer(models.Model):
 
     def __str__(self):
         return self.user.username
-    
-    @receiver(post_save, sender=User)
-    def create_or_update_user_profile(sender, instance, created, **kwargs):
-        """
-        Create or update the user profile
-        """
-        if created:
-            Customer.objects.create(user=instance)
-        # Existing users: just save the profile
-        instance.customer.save()
+
+
+class PasswordResetTokenQuerySet(models.QuerySet):
+    """
+    Filters on token age, answered from the created_at index.
+    """
+
+    @staticmethod
+    def cutoff():
+        return timezone.now() - settings.PASSWORD_RESET_TOKEN_LIFETIME
+
+    def valid(self):
+        return self.filter(created_at__gt=self.cutoff())
+
+    def expired(self):
+        return self.filter(created_at__lte=self.cutoff())
 
 
 class PasswordResetToken(models.Model):
+    """
+    Single-use token emailed to reset a password. Tokens older than
+    PASSWORD_RESET_TOKEN_LIFETIME are rejected by the lookup itself and
+    removed by the purge_password_reset_tokens command.
+    """
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    objects = PasswordResetTokenQuerySet.as_manager()
 
     def is_expired(self):
-        from django.utils import timezone
-        return (timezone.now() - self.created_at).total_seconds() > 86400  # 24 hours
+        return self.created_at <= PasswordResetTokenQuerySet.cutoff()
+
+
+class OutboundEmail(models.Model):
+    """
+    Transactional email queued by a request and delivered later by the
+    send_queued_emails worker, so views never wait on the mail server.
+
+    Attributes:
+        subject (str): Subject line.
+        body (str): Plain text body.
+        html_body (str): Optional HTML alternative.
+        from_email (str): Sender address.
+        to (list): Recipient addresses.
+        status (str): pending, sent or failed.
+        attempts (int): Number of delivery attempts made so far.
+        next_attempt_at (datetime): Earliest time of the next attempt.
+        last_error (str): Error raised by the last failed attempt.
+        created_at (datetime): When the email was queued.
+        sent_at (datetime): When the email was delivered.
+    """
+
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True, default='')
+    from_email = models.CharField(max_length=254)
+    to = models.JSONField()
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['next_attempt_at'],
+                condition=models.Q(status='pending'),
+                name='outboundemail_due_idx',
+            ),
+        ]
+
+    @classmethod
+    def enqueue(cls, subject, body, to, html_body='', from_email=None):
+        """
+        Queue an email for the background sender.
+        """
+        return cls.objects.create(
+            subject=subject,
+            body=body,
+            html_body=html_body,
+            from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+            to=list(to),
+        )
+
+    def to_message(self, connection=None):
+        """
+        Build the EmailMultiAlternatives to send for this row.
+        """
+        message = EmailMultiAlternatives(
+            self.subject,
+            self.body,
+            self.from_email,
+            self.to,
+            connection=connection,
+        )
+        if self.html_body:
+            message.attach_alternative(self.html_body, "text/html")
+        return message
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)}"
+
+
+class IdempotencyKeyQuerySet(models.QuerySet):
+
+    def expired(self):
+        return self.filter(expires_at__lte=timezone.now())
+
+
+class IdempotencyKey(models.Model):
+    """
+    The outcome of a request sent with an Idempotency-Key header, kept so
+    that retries of it are answered without running it again. See
+    users.idempotency.
+
+    Attributes:
+        key (str): Hash of the header, the user and the endpoint.
+        fingerprint (str): Hash of the request body.
+        status_code (int): Status of the stored response; None while the
+            first request is still running.
+        content (bytes): Body of the stored response.
+        content_type (str): Content type of the stored response.
+        created_at (datetime): When the first request arrived.
+        expires_at (datetime): When the record is forgotten: the TTL once
+            a response is stored, or when a request that never finished
+            is presumed dead.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    content = models.BinaryField(default=bytes)
+    content_type = models.CharField(max_length=255, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    objects = IdempotencyKeyQuerySet.as_manager()
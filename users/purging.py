@@ -0,0 +1,30 @@
+import time
+
+
+def purge_in_batches(queryset, order_by, batch_size, pause=0):
+    """
+    Delete the rows of ``queryset`` in batches, oldest first.
+
+    Each batch's ids are read from the ``order_by`` index and deleted by
+    primary key in a statement of its own, so no statement locks more
+    than ``batch_size`` rows or holds its locks for long.
+
+    Args:
+        queryset (QuerySet): The rows to delete.
+        order_by (str): Indexed field to take the rows in order of.
+        batch_size (int): Most rows deleted per statement.
+        pause (float): Seconds to sleep between batches.
+
+    Returns:
+        int: Number of rows deleted.
+    """
+    deleted = 0
+    while True:
+        ids = list(
+            queryset.order_by(order_by).values_list('pk', flat=True)[:batch_size]
+        )
+        if ids:
+            deleted += queryset.model.objects.filter(pk__in=ids).delete()[0]
+        if len(ids) < batch_size:
+            return deleted
+        time.sleep(pause)
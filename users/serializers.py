@@ -1,6 +1,8 @@
 from django.contrib.auth.models import User
 from rest_framework import serializers, generics
+from rest_framework.permissions import AllowAny
 from django.contrib.auth import get_user_model
+from .idempotency import IdempotencyMixin
 from .models import PasswordResetToken
 
 User = get_user_model()
@@ -15,8 +17,9 @@ class RegisterSerializer(serializers.ModelSerializer):
         user = User.objects.create_user(**validated_data)
         return user
 
-class RegisterView(generics.CreateAPIView):
+class RegisterView(IdempotencyMixin, generics.CreateAPIView):
     serializer_class = RegisterSerializer
+    permission_classes = [AllowAny]
 
 
 class PasswordResetRequestSerializer(serializers.Serializer):
@@ -33,18 +36,21 @@ class PasswordResetConfirmSerializer(serializers.Serializer):
     new_password = serializers.CharField(write_only=True, min_length=8)
 
     def validate_token(self, value):
+        # Expired tokens are filtered out by the query and left for
+        # purge_password_reset_tokens; the user comes in the same query
         try:
-            self.token_obj = PasswordResetToken.objects.get(token=value)
+            self.token_obj = (
+                PasswordResetToken.objects.valid()
+                .select_related('user')
+                .get(token=value)
+            )
         except PasswordResetToken.DoesNotExist:
-            raise serializers.ValidationError("Invalid token.")
-        if self.token_obj.is_expired():
-            self.token_obj.delete()
-            raise serializers.ValidationError("Token expired.")
+            raise serializers.ValidationError("Invalid or expired token.")
         return value
 
     def save(self):
         user = self.token_obj.user
         user.set_password(self.validated_data['new_password'])
-        user.save()
+        user.save(update_fields=['password'])
         self.token_obj.delete()
         return user
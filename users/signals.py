@@ -1,30 +1,35 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.contrib.auth.signals import user_logged_in
 from django.dispatch import receiver
 from django.contrib.auth.models import User
+from rest_framework_simplejwt.settings import api_settings
 
-from store.models import Order, Customer
+from store.models import Customer
+from store.services import claim_guest_orders
+from users.authentication import user_cache
 
 
 @receiver(post_save, sender=User)
 def handle_user_post_save(sender, instance, created, **kwargs):
     """
-    Handles customer creation, saving, and assigning guest orders after a User is saved.
+    Creates the customer profile and assigns guest orders when a User is
+    created. The profile holds nothing derived from the User, so later
+    saves (activation, password or last_login changes) need no work here.
     """
-    user = instance
+    if not created:
+        return
+    customer = Customer.objects.create(user=instance)
+    claim_guest_orders(instance, customer=customer)
 
-    # Ensure customer exists
-    customer, _ = Customer.objects.get_or_create(user=user)
 
-    # If it's a new user, assign guest orders
-    if created:
-        guest_orders = Order.objects.filter(
-            customer__isnull=True,
-            email=user.email
-        )
-        for order in guest_orders:
-            order.customer = customer
-            order.save()
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def evict_cached_user(sender, instance, **kwargs):
+    """
+    Drops the user from the JWT user cache so deactivation and password
+    changes take effect on the next request.
+    """
+    user_cache.evict(getattr(instance, api_settings.USER_ID_FIELD))
 
 
 @receiver(user_logged_in)
@@ -32,13 +37,4 @@ def assign_guest_orders_on_login(sender, request, user, **kwargs):
     """
     Assigns guest orders to the user's customer profile on login.
     """
-    customer, _ = Customer.objects.get_or_create(user=user)
-
-    guest_orders = Order.objects.filter(
-        customer__isnull=True,
-        email=user.email
-    )
-
-    for order in guest_orders:
-        order.customer = customer
-        order.save()
+    claim_guest_orders(user)
@@ -1,3 +1,417 @@
-from django.test import TestCase
+import multiprocessing
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import (
+    Client,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.tokens import RefreshToken
 
-# Create your tests here.
+from store.cache import guest_orders_key
+from store.models import Order
+from store.services import claim_guest_orders
+from users.idempotency import _hash, claim, release
+from users.management.commands.send_queued_emails import (
+    Command as SendQueuedEmails,
+)
+from users.models import (
+    Customer,
+    IdempotencyKey,
+    OutboundEmail,
+    PasswordResetToken,
+)
+from users.authentication import user_cache
+from users.throttling import AnonRateThrottle
+from users.serializers import PasswordResetConfirmSerializer
+from users.views import protected_view
+
+User = get_user_model()
+
+
+class BurstThrottle(AnonRateThrottle):
+    rate = '500/min'
+    # Pin the clock to the start of a window so the limit is exact
+    timer = staticmethod(lambda: 600000.0)
+
+
+def _count_allowed(attempts):
+    throttle = BurstThrottle()
+    request = SimpleNamespace(
+        user=AnonymousUser(), META={'REMOTE_ADDR': '203.0.113.7'}
+    )
+    return sum(
+        throttle.allow_request(request, None) for _ in range(attempts)
+    )
+
+
+class TemporaryThrottleStoreMixin:
+    """
+    Give each test a fresh throttle counter store, so rate limits don't
+    carry over between tests or test runs.
+    """
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        store = override_settings(THROTTLE_STORE={
+            'BACKEND': 'users.throttling.SQLiteCounterStore',
+            'LOCATION': str(Path(directory.name) / 'throttle.sqlite3'),
+        })
+        store.enable()
+        self.addCleanup(store.disable)
+
+
+class UserSaveQueryCountTests(TestCase):
+    """
+    Pin the number of queries each kind of User save costs, so that work
+    creeping back into the post_save pipeline fails loudly.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def test_register_creates_profile_and_claims_guest_orders(self):
+        order = Order.objects.create(
+            first_name='Guest', last_name='Buyer', email='guest@example.com',
+            phone_number='1', street_address1='1 Street', country='IE',
+            town='Town', postcode='A1',
+        )
+        # INSERT user, INSERT customer, UPDATE guest orders
+        with self.assertNumQueries(3):
+            user = User.objects.create_user(
+                username='guest', email='guest@example.com', password='pw'
+            )
+        order.refresh_from_db()
+        self.assertEqual(order.customer, Customer.objects.get(user=user))
+
+    def test_verify_email_save_is_a_single_update(self):
+        user = User.objects.create_user(
+            username='new', email='new@example.com', password='pw',
+            is_active=False,
+        )
+        user.is_active = True
+        with self.assertNumQueries(1):
+            user.save(update_fields=['is_active'])
+
+    def test_password_reset_save_is_a_single_update(self):
+        user = User.objects.create_user(
+            username='reset', email='reset@example.com', password='pw'
+        )
+        token = PasswordResetToken.objects.create(user=user)
+        serializer = PasswordResetConfirmSerializer(data={
+            'token': str(token.token),
+            'new_password': 'a-new-password',
+        })
+        self.assertTrue(serializer.is_valid())
+        # UPDATE password, DELETE token; the user came with the token
+        with self.assertNumQueries(2):
+            serializer.save()
+        user.refresh_from_db()
+        self.assertTrue(user.check_password('a-new-password'))
+
+    def test_repeat_login_skips_guest_order_claim(self):
+        user = User.objects.create_user(
+            username='repeat', email='repeat@example.com', password='pw'
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(claim_guest_orders(user), 0)
+
+
+class GuestOrderClaimFlagTests(TestCase):
+
+    def test_guest_order_clears_the_claim_flag_on_commit(self):
+        user = User.objects.create_user(
+            username='guest', email='guest@example.com', password='pw'
+        )
+        key = guest_orders_key(user.email)
+        cache.delete(key)
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            claim_guest_orders(user)
+        self.assertEqual(
+            cache_set.call_args.kwargs['timeout'],
+            settings.GUEST_ORDERS_FLAG_TIMEOUT,
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(
+                first_name='Guest', last_name='Buyer', email=user.email,
+                phone_number='1', street_address1='1 Street', country='IE',
+                town='Town', postcode='A1',
+            )
+            # Not before the order is visible to a concurrent login
+            self.assertIs(cache.get(key), False)
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(claim_guest_orders(user), 1)
+        order.refresh_from_db()
+        self.assertEqual(order.customer, user.customer)
+
+
+@override_settings(EMAIL_MAX_ATTEMPTS=2)
+class SendQueuedEmailsTests(TestCase):
+
+    def test_pending_emails_are_sent_in_one_pass(self):
+        for n in range(3):
+            OutboundEmail.enqueue(
+                f'Subject {n}', 'Body', [f'user{n}@example.com'],
+                html_body='<p>Body</p>',
+            )
+        call_command('send_queued_emails', once=True, stdout=StringIO())
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+        self.assertFalse(
+            OutboundEmail.objects.exclude(status=OutboundEmail.SENT).exists()
+        )
+
+    def test_failures_back_off_then_give_up(self):
+        email = OutboundEmail.enqueue('Subject', 'Body', ['a@example.com'])
+        with mock.patch.object(
+            OutboundEmail, 'to_message', side_effect=OSError('down')
+        ):
+            call_command('send_queued_emails', once=True, stdout=StringIO())
+            email.refresh_from_db()
+            self.assertEqual(email.status, OutboundEmail.PENDING)
+            self.assertEqual(email.attempts, 1)
+            self.assertGreater(email.next_attempt_at, timezone.now())
+
+            OutboundEmail.objects.update(next_attempt_at=timezone.now())
+            call_command('send_queued_emails', once=True, stdout=StringIO())
+            email.refresh_from_db()
+            self.assertEqual(email.status, OutboundEmail.FAILED)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_claimed_batch_is_hidden_while_it_sends(self):
+        email = OutboundEmail.enqueue('Subject', 'Body', ['a@example.com'])
+        seen_by_others = []
+        to_message = OutboundEmail.to_message
+
+        def send_while_another_worker_polls(self, **kwargs):
+            seen_by_others.extend(SendQueuedEmails().claim_batch(10))
+            return to_message(self, **kwargs)
+
+        with mock.patch.object(
+            OutboundEmail, 'to_message', send_while_another_worker_polls
+        ):
+            call_command('send_queued_emails', once=True, stdout=StringIO())
+        self.assertEqual(seen_by_others, [])
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboundEmail.SENT)
+        self.assertEqual(email.attempts, 1)
+
+    def test_batch_of_a_dead_worker_is_retried_after_its_claim_lapses(self):
+        email = OutboundEmail.enqueue('Subject', 'Body', ['a@example.com'])
+        SendQueuedEmails().claim_batch(10)
+        call_command('send_queued_emails', once=True, stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 0)
+
+        OutboundEmail.objects.update(next_attempt_at=timezone.now())
+        call_command('send_queued_emails', once=True, stdout=StringIO())
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboundEmail.SENT)
+        self.assertEqual(email.attempts, 2)
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class PasswordResetTokenExpiryTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='expiry', email='expiry@example.com', password='pw'
+        )
+
+    def make_tokens(self, count, age):
+        tokens = [PasswordResetToken.objects.create(user=self.user) for _ in range(count)]
+        PasswordResetToken.objects.filter(
+            pk__in=[token.pk for token in tokens]
+        ).update(created_at=timezone.now() - age)
+        return tokens
+
+    def test_expired_token_is_rejected_by_the_lookup(self):
+        expired, = self.make_tokens(1, timedelta(hours=25))
+        fresh, = self.make_tokens(1, timedelta(hours=1))
+        serializer = PasswordResetConfirmSerializer(data={
+            'token': str(expired.token), 'new_password': 'a-new-password',
+        })
+        with self.assertNumQueries(1):
+            self.assertFalse(serializer.is_valid())
+        self.assertIn('token', serializer.errors)
+        serializer = PasswordResetConfirmSerializer(data={
+            'token': str(fresh.token), 'new_password': 'a-new-password',
+        })
+        self.assertTrue(serializer.is_valid())
+
+    def test_purge_deletes_only_expired_tokens_in_batches(self):
+        self.make_tokens(5, timedelta(days=2))
+        fresh = self.make_tokens(2, timedelta(hours=1))
+        out = StringIO()
+        # Two full batches, then a short one that ends the purge
+        with self.assertNumQueries(6):
+            call_command('purge_password_reset_tokens', batch_size=2, stdout=out)
+        self.assertIn('Deleted 5', out.getvalue())
+        self.assertEqual(
+            set(PasswordResetToken.objects.values_list('pk', flat=True)),
+            {token.pk for token in fresh},
+        )
+
+
+class CachedJWTAuthenticationTests(TemporaryThrottleStoreMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        user_cache.clear()
+        self.user = User.objects.create_user(
+            username='cached', email='cached@example.com', password='pw'
+        )
+        token = RefreshToken.for_user(self.user).access_token
+        self.factory = APIRequestFactory()
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+    def get_protected(self):
+        return protected_view(self.factory.get('/api/protected/', **self.auth))
+
+    def test_repeat_requests_skip_the_user_query(self):
+        self.assertEqual(self.get_protected().status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_protected().status_code, 200)
+        self.assertEqual(user_cache.stats()['hits'], 1)
+        self.assertEqual(user_cache.stats()['misses'], 1)
+
+    def test_deactivation_evicts_the_cached_user(self):
+        self.get_protected()
+        self.user.is_active = False
+        self.user.save(update_fields=['is_active'])
+        self.assertEqual(self.get_protected().status_code, 401)
+
+
+class SharedThrottleTests(TemporaryThrottleStoreMixin, SimpleTestCase):
+
+    def test_limit_is_enforced_across_processes(self):
+        processes, attempts = 4, 400
+        started = time.perf_counter()
+        with multiprocessing.get_context('fork').Pool(processes) as pool:
+            allowed = pool.map(_count_allowed, [attempts] * processes)
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(sum(allowed), BurstThrottle().num_requests)
+        checks_per_second = processes * attempts / elapsed
+        self.assertGreater(checks_per_second, 500)
+
+
+@override_settings(
+    ALLOWED_HOSTS=['testserver'],
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class IdempotencyTests(TemporaryThrottleStoreMixin, TestCase):
+
+    def register(self, username, key='register-1'):
+        return self.client.post(
+            '/api/register/', {'username': username, 'password': 'pw-12345'},
+            content_type='application/json', HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retry_replays_the_first_response(self):
+        first = self.register('once')
+        self.assertEqual(first.status_code, 201)
+        with self.assertNumQueries(1):
+            retry = self.register('once')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(User.objects.filter(username='once').count(), 1)
+
+        # A new key runs the view again; the same key with another body fails
+        self.assertEqual(self.register('once', key='register-2').status_code, 400)
+        self.assertEqual(self.register('other').status_code, 422)
+
+    def test_anonymous_keys_are_scoped_to_the_client(self):
+        self.assertEqual(self.register('first').status_code, 201)
+        other = self.client.post(
+            '/api/register/', {'username': 'second', 'password': 'pw-12345'},
+            content_type='application/json', HTTP_IDEMPOTENCY_KEY='register-1',
+            REMOTE_ADDR='10.0.0.2',
+        )
+        self.assertEqual(other.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', other)
+
+    def test_unfinished_claim_is_reused_once_its_request_is_gone(self):
+        key = _hash('register-1', 'anon:127.0.0.1', 'POST', '/api/register/')
+        body = b'{"username": "busy", "password": "pw-12345"}'
+        record = IdempotencyKey.objects.create(
+            key=key, fingerprint=_hash(body),
+            expires_at=timezone.now() + timedelta(minutes=1),
+        )
+        if connection.vendor != 'postgresql':
+            # Without advisory locks a claim only lapses with its timeout
+            with override_settings(IDEMPOTENCY_WAIT=0):
+                self.assertEqual(self.register('busy').status_code, 409)
+            self.assertFalse(User.objects.filter(username='busy').exists())
+            IdempotencyKey.objects.filter(pk=record.pk).update(
+                expires_at=timezone.now()
+                )
+        self.assertEqual(self.register('busy').status_code, 201)
+        self.assertEqual(self.register('busy')['Idempotent-Replayed'], 'true')
+
+    def test_purge_deletes_expired_keys(self):
+        self.register('purged')
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        call_command('purge_idempotency_keys', stdout=StringIO())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Needs advisory locks.')
+@override_settings(
+    ALLOWED_HOSTS=['testserver'],
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class IdempotencyWaitTests(TemporaryThrottleStoreMixin, TransactionTestCase):
+    """
+    A duplicate waits on the first request's lock, not a polling loop.
+    """
+
+    def retry(self):
+        try:
+            return Client().post(
+                '/api/register/', {'username': 'busy', 'password': 'pw-12345'},
+                content_type='application/json',
+                HTTP_IDEMPOTENCY_KEY='register-1',
+            )
+        finally:
+            connection.close()
+
+    def test_duplicate_waits_for_the_request_in_flight(self):
+        key = _hash('register-1', 'anon:127.0.0.1', 'POST', '/api/register/')
+        body = b'{"username": "busy", "password": "pw-12345"}'
+        # Claimed on this thread's connection, as the first request would
+        record = claim(key, _hash(body))
+        with ThreadPoolExecutor(1) as pool:
+            with override_settings(IDEMPOTENCY_WAIT=0.2):
+                self.assertEqual(pool.submit(self.retry).result().status_code, 409)
+            waiting = pool.submit(self.retry)
+            time.sleep(0.2)
+            IdempotencyKey.objects.filter(pk=record.pk).update(
+                status_code=201, content=b'{}', content_type='application/json',
+                )
+            release(key)
+            replayed = waiting.result(timeout=5)
+        self.assertEqual(replayed.status_code, 201)
+        self.assertEqual(replayed['Idempotent-Replayed'], 'true')
+        self.assertFalse(User.objects.filter(username='busy').exists())
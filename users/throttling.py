@@ -0,0 +1,181 @@
+import os
+import sqlite3
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework import throttling
+
+
+class CacheCounterStore:
+    """
+    Counter store on a Django cache alias. Only atomic when the backend's
+    incr() is (Redis and Memcached are; LocMem is, but per process).
+    """
+
+    def __init__(self, location='default'):
+        self.cache = caches[location or 'default']
+
+    def incr(self, key, delta, timeout):
+        self.cache.add(key, 0, timeout)
+        try:
+            return self.cache.incr(key, delta)
+        except ValueError:
+            # Expired between add() and incr()
+            self.cache.add(key, 0, timeout)
+            return self.cache.incr(key, delta)
+
+    def get(self, key):
+        return self.cache.get(key, 0)
+
+
+class SQLiteCounterStore:
+    """
+    Counter store in a SQLite file, shared by every process on the host.
+    Each increment is one atomic upsert, so it enforces limits across
+    local worker processes without a cache server.
+    """
+
+    PURGE_EVERY = 1000
+
+    def __init__(self, location):
+        self.location = str(location)
+        self._local = threading.local()
+
+    def _connection(self):
+        # Connections can't cross a fork, so key them on the process too
+        if getattr(self._local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(
+                self.location, timeout=10, isolation_level=None
+                )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS throttle_counter ('
+                'key TEXT PRIMARY KEY, value INTEGER NOT NULL, '
+                'expires REAL NOT NULL)'
+            )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+            self._local.writes = 0
+        return self._local.connection
+
+    def incr(self, key, delta, timeout):
+        connection = self._connection()
+        now = time.time()
+        value, = connection.execute(
+            'INSERT INTO throttle_counter (key, value, expires) '
+            'VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET '
+            'value = CASE WHEN expires < ? THEN excluded.value '
+            'ELSE value + excluded.value END, '
+            'expires = CASE WHEN expires < ? THEN excluded.expires '
+            'ELSE expires END '
+            'RETURNING value',
+            (key, delta, now + timeout, now, now),
+        ).fetchone()
+        self._local.writes += 1
+        if self._local.writes % self.PURGE_EVERY == 0:
+            connection.execute(
+                'DELETE FROM throttle_counter WHERE expires < ?', (now,)
+                )
+        return value
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value FROM throttle_counter WHERE key = ? AND expires >= ?',
+            (key, time.time()),
+        ).fetchone()
+        return row[0] if row else 0
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_counter_store():
+    """
+    Return the counter store configured by settings.THROTTLE_STORE.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                backend = import_string(settings.THROTTLE_STORE['BACKEND'])
+                _store = backend(settings.THROTTLE_STORE.get('LOCATION'))
+    return _store
+
+
+@receiver(setting_changed)
+def reset_counter_store(setting, **kwargs):
+    global _store
+    if setting == 'THROTTLE_STORE':
+        _store = None
+
+
+class SlidingWindowRateThrottleMixin:
+    """
+    Replaces SimpleRateThrottle's per-key request history with two fixed
+    window counters in a shared store.
+
+    The request count over the last ``duration`` seconds is estimated as
+    the current window's count plus the previous window's count weighted
+    by how much of it still overlaps the sliding window. Each check is one
+    atomic increment and one read, whatever the rate.
+    """
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        window, offset = divmod(self.now, self.duration)
+        self.elapsed = offset / self.duration
+        current_key = f'{self.key}:{int(window)}'
+
+        store = get_counter_store()
+        self.current = store.incr(current_key, 1, 2 * self.duration)
+        self.previous = store.get(f'{self.key}:{int(window) - 1}')
+        if self.previous * (1 - self.elapsed) + self.current > self.num_requests:
+            # Denied requests don't use up the allowance
+            self.current = store.incr(current_key, -1, 2 * self.duration)
+            return self.throttle_failure()
+        return True
+
+    def wait(self):
+        """
+        Seconds until the estimate drops far enough to allow a request.
+        """
+        remaining = 1 - self.elapsed
+        if self.current + 1 > self.num_requests or not self.previous:
+            return remaining * self.duration
+        # Solve previous * (1 - elapsed') + current + 1 <= num_requests
+        needed = 1 - (self.num_requests - self.current - 1) / self.previous
+        return max(needed - self.elapsed, 0) * self.duration
+
+
+class UserRateThrottle(SlidingWindowRateThrottleMixin, throttling.UserRateThrottle):
+    pass
+
+
+class AnonRateThrottle(SlidingWindowRateThrottleMixin, throttling.AnonRateThrottle):
+    pass
+
+
+class ScopedRateThrottle(SlidingWindowRateThrottleMixin, throttling.ScopedRateThrottle):
+
+    def allow_request(self, request, view):
+        # ScopedRateThrottle only learns its rate from the view here
+        self.scope = getattr(view, self.scope_attr, None)
+        if not self.scope:
+            return True
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        return super().allow_request(request, view)
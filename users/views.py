@@ -1,17 +1,17 @@
 from django.contrib.auth.models import User
-from django.core.mail import EmailMultiAlternatives, send_mail
 from django.template.loader import render_to_string
 from django.urls import reverse
 from django.conf import settings
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken, AccessToken
 from datetime import timedelta, datetime
 from django.views.decorators.csrf import csrf_exempt
-from .models import PasswordResetToken
+from .idempotency import IdempotencyMixin
+from .models import OutboundEmail, PasswordResetToken
 from .serializers import (
     PasswordResetRequestSerializer,
     PasswordResetConfirmSerializer,
@@ -55,14 +55,13 @@ def register_user(request):
     text_content = f'Click the link to verify your email: {verify_url}'
     html_content = render_to_string('emails/verify_email.html', {'username': user.username, 'verify_url': verify_url})
 
-    email = EmailMultiAlternatives(subject, text_content, from_email, to_email)
-    email.attach_alternative(html_content, "text/html")
-    email.send()
+    OutboundEmail.enqueue(subject, text_content, to_email, html_body=html_content, from_email=from_email)
 
     return Response({'detail': 'User created. Check your email to verify account.'})
 
 
 @api_view(['GET'])
+@permission_classes([AllowAny])
 def verify_email(request):
     token = request.GET.get('token')
     try:
@@ -71,7 +70,7 @@ def verify_email(request):
         user = User.objects.get(id=user_id)
         if not user.is_active:
             user.is_active = True
-            user.save()
+            user.save(update_fields=['is_active'])
         return Response({'detail': 'Email verified successfully'})
     except Exception:
         return Response({'detail': 'Invalid or expired token'}, status=status.HTTP_400_BAD_REQUEST)
@@ -89,10 +88,9 @@ def resend_verification_email(request):
         verify_url = request.build_absolute_uri(
             reverse('email-verify') + f'?token={str(token)}'
         )
-        send_mail(
+        OutboundEmail.enqueue(
             'Verify your email',
             f'Click the link to verify: {verify_url}',
-            settings.DEFAULT_FROM_EMAIL,
             [user.email],
         )
         return Response({'detail': 'Verification email resent'})
@@ -100,7 +98,9 @@ def resend_verification_email(request):
         return Response({'detail': 'User not found'}, status=404)
 
 
-class PasswordResetRequestView(APIView):
+class PasswordResetRequestView(IdempotencyMixin, APIView):
+    permission_classes = [AllowAny]
+
     def post(self, request):
         serializer = PasswordResetRequestSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -118,18 +118,18 @@ class PasswordResetRequestView(APIView):
 
         html_content = render_to_string("emails/password_reset.html", {
             "reset_link": reset_link,
-            "year": datetime.datetime.now().year,
+            "year": datetime.now().year,
         })
         text_content = f"Reset your password: {reset_link}"
 
-        email = EmailMultiAlternatives(subject, text_content, from_email, [to])
-        email.attach_alternative(html_content, "text/html")
-        email.send()
+        OutboundEmail.enqueue(subject, text_content, [to], html_body=html_content, from_email=from_email)
 
         return Response({"detail": "Password reset link sent."}, status=200)
 
 
-class PasswordResetConfirmView(APIView):
+class PasswordResetConfirmView(IdempotencyMixin, APIView):
+    permission_classes = [AllowAny]
+
     def post(self, request):
         serializer = PasswordResetConfirmSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)